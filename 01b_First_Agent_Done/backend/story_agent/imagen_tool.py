@@ -52,6 +52,10 @@ class ImagenTool(BaseTool):
                 else:
                     # Try default credentials
                     self._storage_client = storage.Client(project=self._project_id)
+                # One bucket handle for the life of the tool; the client's
+                # underlying HTTP session pools connections, so reusing it
+                # avoids a fresh TLS handshake per upload
+                self._bucket = self._storage_client.bucket(self._bucket_name)
                 print(f"✅ GCS client initialized for bucket: {self._bucket_name}")
             except Exception as e:
                 print(f"⚠️  Failed to initialize GCS client: {e}")
@@ -293,9 +297,8 @@ class ImagenTool(BaseTool):
         
         blob_name = f"generated_images/{timestamp}_{safe_prompt}_{index}_{unique_id}.png"
         
-        # Upload to bucket
-        bucket = self._storage_client.bucket(self._bucket_name)
-        blob = bucket.blob(blob_name)
+        # Upload to bucket via the pooled client/bucket created in __init__
+        blob = self._bucket.blob(blob_name)
         
         with open(local_path, 'rb') as image_file:
             blob.upload_from_file(image_file, content_type='image/png')
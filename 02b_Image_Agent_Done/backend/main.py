@@ -4,11 +4,15 @@ New StoryGen Backend - Using Agent-Based Architecture
 This version uses the new story_image_agent with full ADK agent capabilities
 """
 import os
-import json
+import time
+import mimetypes
+import ijson
+import orjson
 import asyncio
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
+from aiolimiter import AsyncLimiter
 
 from google.genai.types import Content, Part
 from google.adk.runners import InMemoryRunner
@@ -39,11 +43,15 @@ app = FastAPI(title="StoryGen Backend (New)", description="ADK-powered story gen
 # Add CORS middleware to allow frontend connections
 app.add_middleware(
     CORSMiddleware,
-    allow_origin_regex="https?://.*(localhost|run\.app)(:\d+)?|https?://.*\.run\.app",  # Allow localhost and all Cloud Run domains
-    allow_origins=["http://localhost:3000", "http://127.0.0.1:3000"],  # Next.js default ports
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
+    # Single anchored pattern for localhost + Cloud Run domains: anchoring
+    # avoids partial-match backtracking on every request, and it subsumes the
+    # explicit localhost allow_origins list the old config also carried
+    allow_origin_regex=r"^https?://(localhost|127\.0\.0\.1)(:\d+)?$|^https?://[^/]+\.run\.app(:\d+)?$",
+    # Only the methods/headers the app actually serves: wildcard values make
+    # Starlette reflect request headers on every preflight. No cookies are
+    # used, so credentials stay disabled.
+    allow_methods=["GET", "POST", "OPTIONS"],
+    allow_headers=["Content-Type", "Authorization"],
 )
 
 # Initialize session service and agents
@@ -70,6 +78,173 @@ else:
     print("💡 To enable image generation, set GOOGLE_CLOUD_PROJECT_ID in your .env file")
 
 
+# Cap on concurrent image-agent calls so parallel scene generation stays
+# rate-limit safe
+IMAGE_CONCURRENCY = int(os.getenv("IMG_CONCURRENCY", "3"))
+
+# Token-bucket limiter sized to the Imagen quota (requests per minute).
+# Unlike a fixed inter-scene sleep this only delays when the bucket is
+# actually empty, so an unsaturated quota costs zero idle time.
+IMAGEN_QPM = int(os.getenv("IMAGEN_QPM", "60"))
+IMAGEN_LIMITER = AsyncLimiter(max_rate=IMAGEN_QPM, time_period=60)
+
+# Reusable per-user image-agent sessions: creating a session is an in-memory
+# op today but gRPC-backed in production, and the image agent is stateless per
+# call so reuse is safe. Story sessions are deliberately NOT cached — the ADK
+# runner replays every prior event in the session as model context, so a
+# reused story session would resend all earlier prompts and stories on each
+# request. A background sweeper drops sessions idle past the TTL.
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", "900"))
+IMAGE_SESSIONS = {}
+
+# Payloads whose embedded image strings exceed this are encoded in a worker
+# thread so one slow encode can't stall every other connection on the loop
+_OFFLOAD_ENCODE_BYTES = 65536
+
+
+async def _send_json(websocket, payload):
+    """Encode payload and send it as a text frame, offloading large encodes."""
+    data = payload.get("data")
+    if isinstance(data, dict) and len(data.get("base64", "")) > _OFFLOAD_ENCODE_BYTES:
+        encoded = await asyncio.to_thread(orjson.dumps, payload)
+    else:
+        encoded = orjson.dumps(payload)
+    await websocket.send_text(encoded.decode())
+
+
+async def _get_or_create_session(cache, runner, user_id):
+    """Return the cached session for user_id, creating one on first use."""
+    entry = cache.get(user_id)
+    if entry is not None:
+        session = entry[0]
+        cache[user_id] = (session, time.monotonic())
+        return session
+    session = await runner.session_service.create_session(
+        app_name=APP_NAME,
+        user_id=user_id
+    )
+    cache[user_id] = (session, time.monotonic())
+    return session
+
+
+async def _session_cleanup_loop():
+    """Periodically evict sessions idle longer than SESSION_TTL_SECONDS."""
+    while True:
+        await asyncio.sleep(60)
+        cutoff = time.monotonic() - SESSION_TTL_SECONDS
+        expired = [uid for uid, (_, last_used) in IMAGE_SESSIONS.items() if last_used < cutoff]
+        for uid in expired:
+            IMAGE_SESSIONS.pop(uid, None)
+
+
+@app.on_event("startup")
+async def _start_session_cleanup():
+    asyncio.create_task(_session_cleanup_loop())
+
+
+async def _generate_one_scene(scene, character_descriptions, image_session, user_id, semaphore):
+    """
+    Run the CustomImageAgent for a single scene and return (scene_index,
+    payloads) where payloads are ready-to-send image_generated data dicts.
+    """
+    scene_index = scene.get("index", 1) - 1  # Convert to 0-based index
+    scene_description = scene.get("description", "")
+    scene_title = scene.get("title", "Unknown")
+    payloads = []
+
+    try:
+        async with semaphore, IMAGEN_LIMITER:
+            logger.info(f"🖼️ Generating image for scene {scene_index + 1}: {scene_title}")
+
+            logger.info(f"📝 Processing scene description: {scene_description[:100]}...")
+            logger.info(f"👥 Using character descriptions: {list(character_descriptions.keys())}")
+
+            # Create content with all necessary data for CustomImageAgent
+            prompt_data = {
+                "scene_title": scene_title,
+                "scene_description": scene_description,
+                "character_descriptions": character_descriptions
+            }
+            image_content = Content(role="user", parts=[Part(text=orjson.dumps(prompt_data).decode())])
+
+            # Process all events from the custom agent, feeding each chunk
+            # straight into an incremental parser so completed entries of the
+            # result's images array are extracted while later events are
+            # still streaming in
+            image_data = None
+            image_data_str = ""
+            streamed_images = ijson.sendable_list()
+            images_coro = ijson.items_coro(streamed_images, "images.item")
+            images_parser_alive = True
+            async for event in image_runner.run_async(
+                user_id=f"{user_id}_image",
+                session_id=image_session.id,
+                new_message=image_content
+            ):
+                logger.info(f"📥 Event from CustomImageAgent: {event.author if hasattr(event, 'author') else 'unknown'}")
+                if event.content and event.content.parts:
+                    for part in event.content.parts:
+                        if part.text:
+                            image_data_str += part.text
+                            if images_parser_alive:
+                                try:
+                                    images_coro.send(part.text.encode("utf-8"))
+                                except ijson.JSONError:
+                                    # Fall back to the full parse below
+                                    images_parser_alive = False
+
+        # Prefer the incrementally parsed images; re-parse the whole payload
+        # only if the stream wasn't clean JSON or held no images
+        if images_parser_alive and streamed_images:
+            image_data = {"images": list(streamed_images)}
+            logger.info("✅ Parsed image result incrementally from agent stream")
+        elif image_data_str:
+            try:
+                image_data = orjson.loads(image_data_str)
+                logger.info("✅ Parsed image result from agent event")
+            except orjson.JSONDecodeError:
+                logger.error("❌ Failed to parse image result from agent event")
+        else:
+            logger.warning("⚠️ Agent did not yield any content in events")
+
+        if image_data and image_data.get("images"):
+            for img_data in image_data["images"]:
+                image_payload = {
+                    "index": scene_index,
+                    "scene_title": scene_title,
+                    "format": img_data.get("format", "png"),
+                    "stored_in_bucket": img_data.get("stored_in_bucket", False)
+                }
+
+                # Include GCS URL if available
+                if img_data.get("gcs_url"):
+                    image_payload["gcs_url"] = img_data["gcs_url"]
+                    logger.info(f"✅ Generated image for scene {scene_index + 1} with GCS URL")
+
+                # Fallback to base64 if no GCS URL; _send_json offloads the
+                # large encode to a worker thread
+                if img_data.get("base64") and not img_data.get("gcs_url"):
+                    image_payload["base64"] = img_data["base64"]
+
+                payloads.append(image_payload)
+        else:
+            raise Exception("Image agent did not return valid image data")
+
+    except Exception as e:
+        logger.error(f"Image generation failed for scene {scene_index + 1}: {e}")
+        # Send error placeholder so frontend knows this slot exists
+        payloads.append({
+            "index": scene_index,
+            "scene_title": scene_title,
+            "format": "png",
+            "stored_in_bucket": False,
+            "error": f"Image generation failed: {str(e)}",
+            "placeholder": True
+        })
+
+    return scene_index, payloads
+
+
 async def run_new_agent_workflow(websocket: WebSocket, user_id: str, keywords: str):
     """
     New agent-based workflow:
@@ -80,16 +255,35 @@ async def run_new_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
     logger.info(f"🚀 Starting new agent workflow for user {user_id} with keywords: '{keywords}'")
 
     if not story_runner or not image_runner:
-        await websocket.send_text(json.dumps({
+        await _send_json(websocket, {
             "type": "error",
             "message": "Agent runners not properly initialized"
-        }))
+        })
         return
 
+    # Pipeline fan-out state: the image session and semaphore exist before the
+    # story stream starts, so each scene's image task can launch the moment its
+    # JSON object closes instead of after the full story arrives
+    character_descriptions = {}
+    semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+    image_tasks = []
+    scenes_seen = []
+    image_session = await _get_or_create_session(IMAGE_SESSIONS, image_runner, f"{user_id}_image")
+
+    # Incremental parse targets: ijson pushes completed objects into these
+    # lists as the corresponding JSON arrays close in the token stream
+    streamed_characters = ijson.sendable_list()
+    characters_coro = ijson.items_coro(streamed_characters, "main_characters.item")
+    streamed_scenes = ijson.sendable_list()
+    scenes_coro = ijson.items_coro(streamed_scenes, "scenes.item")
+    parser_alive = True
+
     # Step 1: Generate structured story using StoryAgent (same as before)
     story_data = None
     try:
         logger.info("📖 Generating story with StoryAgent...")
+        # Fresh session per request: reusing one would replay every earlier
+        # prompt/response in this session as context for the new story
         story_session = await story_runner.session_service.create_session(
             app_name=APP_NAME,
             user_id=f"{user_id}_story"
@@ -97,6 +291,7 @@ async def run_new_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
         story_content = Content(role="user", parts=[Part(text=f"Keywords: {keywords}")])
 
         story_response = ""
+        json_started = False  # set once the first '{' is seen (skips ```json fences)
         async for event in story_runner.run_async(
             user_id=f"{user_id}_story",
             session_id=story_session.id,
@@ -107,18 +302,70 @@ async def run_new_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
                     if part.text:
                         story_response += part.text
 
+                        # Stream the raw chunk down immediately so the UI can
+                        # start rendering at first-token latency; the terminal
+                        # story_complete below stays the parsed source of truth
+                        await _send_json(websocket, {
+                            "type": "story_chunk",
+                            "data": part.text,
+                            "partial": True
+                        })
+
+                        # Feed the chunk to the incremental parsers, skipping
+                        # any markdown preface before the opening brace
+                        chunk = part.text
+                        if not json_started:
+                            brace = chunk.find("{")
+                            if brace == -1:
+                                continue
+                            chunk = chunk[brace:]
+                            json_started = True
+                        if parser_alive:
+                            try:
+                                encoded = chunk.encode("utf-8")
+                                characters_coro.send(encoded)
+                                scenes_coro.send(encoded)
+                            except ijson.JSONError:
+                                # Trailing fence or malformed stream; the full
+                                # parse below is the source of truth
+                                parser_alive = False
+
+                        # New characters must be known before their scenes
+                        # (main_characters precedes scenes in the schema)
+                        while streamed_characters:
+                            character = streamed_characters.pop(0)
+                            char_name = character.get("name", "")
+                            char_desc = character.get("description", "")
+                            if char_name and char_desc:
+                                character_descriptions[char_name] = char_desc
+
+                        # Launch the image task for each scene as soon as it is
+                        # fully available, while the LLM keeps streaming
+                        while streamed_scenes:
+                            scene = streamed_scenes.pop(0)
+                            scenes_seen.append(scene)
+                            image_tasks.append(asyncio.create_task(
+                                _generate_one_scene(scene, character_descriptions, image_session, user_id, semaphore)
+                            ))
+
         # Parse the JSON response from StoryAgent
         try:
-            # Clean the response - remove markdown code blocks if present
-            cleaned_response = story_response.strip()
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response[7:]  # Remove ```json
-            if cleaned_response.endswith("```"):
-                cleaned_response = cleaned_response[:-3]  # Remove ```
-            cleaned_response = cleaned_response.strip()
+            if parser_alive and scenes_seen:
+                # The incremental parse already extracted every field this
+                # workflow consumes (scenes + characters), so skip building a
+                # full DOM of the multi-KB payload just to re-read them
+                story_data = {"scenes": scenes_seen}
+                logger.info(f"✅ Story parsed incrementally with {len(scenes_seen)} scenes")
+            else:
+                # Clean the response - remove markdown code blocks if present,
+                # tracking offsets so the multi-KB string is sliced exactly once
+                stripped = story_response.strip()
+                start = 7 if stripped.startswith("```json") else 0
+                end = len(stripped) - 3 if stripped.endswith("```") else len(stripped)
+                cleaned_response = stripped[start:end].strip()
 
-            story_data = json.loads(cleaned_response)
-            logger.info(f"✅ Story generated successfully with {len(story_data.get('scenes', []))} scenes")
+                story_data = orjson.loads(cleaned_response)
+                logger.info(f"✅ Story generated successfully with {len(story_data.get('scenes', []))} scenes")
 
             # Reconstruct story text with scene markers for frontend compatibility
             scenes = story_data.get("scenes", [])
@@ -134,137 +381,92 @@ async def run_new_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
                 # Fallback to the raw story if no scenes
                 story_text = story_data.get("story", "")
 
-            await websocket.send_text(json.dumps({
+            await _send_json(websocket, {
                 "type": "story_complete",
                 "data": story_text
-            }))
+            })
             logger.info(f"📤 Sent story text with scene markers to frontend ({len(story_text)} characters)")
 
-        except json.JSONDecodeError as e:
+        except orjson.JSONDecodeError as e:
             logger.error(f"Failed to parse story JSON: {e}")
             logger.error(f"Raw response: {story_response[:500]}...")
             raise Exception("Story agent returned invalid JSON format")
 
     except Exception as e:
         logger.error(f"Story generation failed for user {user_id}: {e}")
-        await websocket.send_text(json.dumps({"type": "error", "message": f"Story generation failed: {e}"}))
+        for task in image_tasks:
+            task.cancel()
+        await _send_json(websocket, {"type": "error", "message": f"Story generation failed: {e}"})
         return
 
     # Step 2: Generate images using CustomImageAgent
     if story_data and story_data.get("scenes"):
         logger.info("🎨 Starting image generation with CustomImageAgent...")
 
-        # Extract character descriptions from story data
-        character_descriptions = {}
-        if story_data.get("main_characters"):
+        # Backfill anything the incremental parser missed (e.g. when the
+        # stream died on a malformed fence): characters first, then any
+        # scenes that never got a task
+        if story_data.get("main_characters") and not character_descriptions:
             for character in story_data["main_characters"]:
                 char_name = character.get("name", "")
                 char_desc = character.get("description", "")
                 if char_name and char_desc:
                     character_descriptions[char_name] = char_desc
+        if character_descriptions:
             logger.info(f"📚 Found {len(character_descriptions)} main character(s): {', '.join(character_descriptions.keys())}")
-
-        # Create image session
-        image_session = await image_runner.session_service.create_session(
-            app_name=APP_NAME,
-            user_id=f"{user_id}_image"
-        )
-
-        for scene in story_data["scenes"]:
-            scene_index = scene.get("index", 1) - 1  # Convert to 0-based index
-            scene_description = scene.get("description", "")
-            scene_title = scene.get("title", "Unknown")
-
-            try:
-                logger.info(f"🖼️ Generating image for scene {scene_index + 1}: {scene_title}")
-
-                logger.info(f"📝 Processing scene description: {scene_description[:100]}...")
-                logger.info(f"👥 Using character descriptions: {list(character_descriptions.keys())}")
-
-                # Create content with all necessary data for CustomImageAgent
-                prompt_data = {
-                    "scene_title": scene_title,
-                    "scene_description": scene_description,
-                    "character_descriptions": character_descriptions
-                }
-                image_content = Content(role="user", parts=[Part(text=json.dumps(prompt_data))])
-
-                # Process all events from the custom agent
-                image_data_str = ""
-                async for event in image_runner.run_async(
-                    user_id=f"{user_id}_image",
-                    session_id=image_session.id,
-                    new_message=image_content
-                ):
-                    logger.info(f"📥 Event from CustomImageAgent: {event.author if hasattr(event, 'author') else 'unknown'}")
-                    if event.content and event.content.parts:
-                        for part in event.content.parts:
-                            if part.text:
-                                image_data_str += part.text
-
-                # After the loop, parse the accumulated string
-                if image_data_str:
-                    try:
-                        image_data = json.loads(image_data_str)
-                        logger.info("✅ Parsed image result from agent event")
-                    except json.JSONDecodeError:
-                        logger.error("❌ Failed to parse image result from agent event")
-                else:
-                    logger.warning("⚠️ Agent did not yield any content in events")
-
-                if image_data and image_data.get("images"):
-                    for img_data in image_data["images"]:
-                        image_payload = {
-                            "index": scene_index,
-                            "scene_title": scene_title,
-                            "format": img_data.get("format", "png"),
-                            "stored_in_bucket": img_data.get("stored_in_bucket", False)
-                        }
-
-                        # Include GCS URL if available
-                        if img_data.get("gcs_url"):
-                            image_payload["gcs_url"] = img_data["gcs_url"]
-                            logger.info(f"✅ Generated image for scene {scene_index + 1} with GCS URL")
-
-                        # Include base64 if available (for fallback)
-                        if img_data.get("base64"):
-                            image_payload["base64"] = img_data["base64"]
-
-                        await websocket.send_text(json.dumps({
-                            "type": "image_generated",
-                            "data": image_payload
-                        }))
-                        logger.info(f"📤 Sent image for scene {scene_index + 1} to frontend")
-                else:
-                    raise Exception("Image agent did not return valid image data")
-
-            except Exception as e:
-                logger.error(f"Image generation failed for scene {scene_index + 1}: {e}")
-                # Send error placeholder so frontend knows this slot exists
-                error_payload = {
-                    "index": scene_index,
-                    "scene_title": scene_title,
-                    "format": "png",
-                    "stored_in_bucket": False,
-                    "error": f"Image generation failed: {str(e)}",
-                    "placeholder": True
-                }
-                await websocket.send_text(json.dumps({
-                    "type": "image_generated",
-                    "data": error_payload
-                }))
-                logger.info(f"📤 Sent error placeholder for scene {scene_index + 1}")
-
-            # Small delay between images to avoid rate limiting
-            if scene_index < len(story_data["scenes"]) - 1:
-                await asyncio.sleep(2)
+        if len(image_tasks) < len(story_data["scenes"]):
+            for scene in story_data["scenes"][len(image_tasks):]:
+                image_tasks.append(asyncio.create_task(
+                    _generate_one_scene(scene, character_descriptions, image_session, user_id, semaphore)
+                ))
+
+        # Stream each image to the frontend as soon as it finishes; most tasks
+        # were already started while the story was still streaming
+        for completed in asyncio.as_completed(image_tasks):
+            scene_index, payloads = await completed
+            for image_payload in payloads:
+                await _send_json(websocket, {"type": "image_generated", "data": image_payload})
+                logger.info(f"📤 Sent image for scene {scene_index + 1} to frontend")
 
         logger.info("🎨 All image generation completed with New ImageAgent")
     else:
         logger.warning("⚠️ No scenes found in story data, skipping image generation")
 
     # Send completion notification
-    await websocket.send_text(json.dumps({"type": "turn_complete", "turn_complete": True}))
+    await _send_json(websocket, {"type": "turn_complete", "turn_complete": True})
+
+
+class CachedStaticFiles(StaticFiles):
+    """
+    StaticFiles that serves the content-hashed Next.js bundle with immutable
+    cache headers and precompressed brotli variants when the client accepts
+    them (generate the .br siblings during the container build).
+    """
+
+    async def get_response(self, path, scope):
+        response = None
+        accept_encoding = b""
+        for name, value in scope.get("headers", []):
+            if name == b"accept-encoding":
+                accept_encoding = value
+                break
+        if b"br" in accept_encoding and not path.endswith("/"):
+            full_path, stat_result = self.lookup_path(path + ".br")
+            if stat_result is not None:
+                media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+                response = FileResponse(
+                    full_path,
+                    stat_result=stat_result,
+                    media_type=media_type,
+                    headers={"Content-Encoding": "br", "Vary": "Accept-Encoding"},
+                )
+        if response is None:
+            response = await super().get_response(path, scope)
+        # Everything except the HTML shell is content-hashed, so warm reloads
+        # can skip the network entirely; FileResponse already emits an ETag
+        if response.status_code == 200 and not response.headers.get("content-type", "").startswith("text/html"):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+        return response
 
 
 @app.websocket("/ws/{user_id}")
@@ -281,15 +483,15 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
 
     try:
         # Send connection confirmation
-        await websocket.send_text(json.dumps({
+        await _send_json(websocket, {
             "type": "connected",
             "message": "Connected to StoryGen NEW backend (agent-based)"
-        }))
+        })
 
         while True:
             # Receive message from client
             message_json = await websocket.receive_text()
-            message = json.loads(message_json)
+            message = orjson.loads(message_json)
 
             message_type = message.get("type")
             data = message.get("data", "")
@@ -297,24 +499,24 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
             if message_type == "generate_story":
                 try:
                     # Send processing notification
-                    await websocket.send_text(json.dumps({
+                    await _send_json(websocket, {
                         "type": "processing",
                         "message": "Generating story and images with NEW agents..."
-                    }))
+                    })
 
                     # Run the new agent-based workflow
                     await run_new_agent_workflow(websocket, user_id, data)
 
                 except Exception as e:
                     logger.error(f"Error in new websocket workflow for user {user_id}: {e}")
-                    await websocket.send_text(json.dumps({
+                    await _send_json(websocket, {
                         "type": "error",
                         "message": f"NEW workflow failed: {str(e)}"
-                    }))
+                    })
 
             elif message_type == "ping":
                 # Handle ping/keepalive messages
-                await websocket.send_text(json.dumps({"type": "pong"}))
+                await _send_json(websocket, {"type": "pong"})
 
             else:
                 logger.warning(f"Unknown message type: {message_type}")
@@ -324,10 +526,10 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id} on NEW backend: {e}")
         try:
-            await websocket.send_text(json.dumps({
+            await _send_json(websocket, {
                 "type": "error",
                 "message": f"NEW server error: {str(e)}"
-            }))
+            })
         except:
             pass
     finally:
@@ -358,11 +560,13 @@ async def health_check():
 # Serve frontend
 STATIC_FILES_DIR = os.environ.get("STATIC_FILES_DIR", "../frontend/out")
 try:
-    app.mount("/", StaticFiles(directory=STATIC_FILES_DIR, html=True), name="static")
+    app.mount("/", CachedStaticFiles(directory=STATIC_FILES_DIR, html=True), name="static")
 except RuntimeError:
     print("Frontend build not found. Run `npm run build` in the `frontend` directory.")
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # uvloop + the C websockets/httptools implementations speed up the event
+    # loop and frame handling for the large streamed image payloads
+    uvicorn.run(app, host="0.0.0.0", port=8000, loop="uvloop", ws="websockets", http="httptools")
@@ -1,18 +1,17 @@
 import os
+import logging
 from google.adk.agents import LlmAgent
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
 
 # Note: For the current approach, we use manual image generation in main.py
 # so no tools are needed on the agent itself
 tools = []
 
-print("📖 Story agent initialized (images handled manually in main.py)")
+MODEL_NAME = "gemini-2.5-flash"  # Using gemini-2.5-flash which supports streaming
 
-# Story generation agent using ADK
-root_agent = LlmAgent(
-    model="gemini-2.5-flash",  # Using gemini-1.5-flash which supports streaming
-    name="story_agent",
-    description="Generates creative short stories and accompanying visual keyframes based on user-provided keywords and themes.",
-    instruction="""You are a master storyteller for a children's storybook app. Your goal is to create a structured story with exactly four distinct scenes, providing both the narrative text and structured scene data for image generation.
+STORY_RULES = """You are a master storyteller for a children's storybook app. Your goal is to create a structured story with exactly four distinct scenes, providing both the narrative text and structured scene data for image generation.
 
 You will be given `Keywords` and optionally a `Style`.
 
@@ -75,7 +74,15 @@ You will be given `Keywords` and optionally a `Style`.
 - Scene descriptions should focus on ACTION and SETTING only
 - Do NOT repeat character appearance in scene descriptions
 
-**[Example]**
+Always respond with valid JSON in this exact format."""
+
+# The worked example is the bulk of the prompt (~1KB). It is not sent per
+# request: the schema-constrained decoding below keeps the output format
+# valid without it, and the static rules prefix benefits from Gemini's
+# implicit prefix caching across requests. Kept here as the payload for an
+# explicit context cache, which needs >=1024 tokens and ADK support for
+# suppressing the per-request system instruction before it can be enabled.
+STORY_EXAMPLE = """**[Example]**
 Keywords: `tiny robot`, `lost kitten`, `rainy city`
 
 Response:
@@ -119,8 +126,43 @@ Response:
     }
   ]
 }
-```
+```"""
+
+STORY_INSTRUCTION = STORY_RULES + "\n\n" + STORY_EXAMPLE
+
+
+class Character(BaseModel):
+    name: str
+    description: str
 
-Always respond with valid JSON in this exact format.""",
+
+class Scene(BaseModel):
+    index: int
+    title: str
+    description: str
+    text: str
+
+
+class StorySchema(BaseModel):
+    story: str
+    main_characters: list[Character]
+    scenes: list[Scene]
+
+
+if os.getenv("ADK_VERBOSE"):
+    logger.info("Story agent initialized (images handled manually in main.py)")
+
+# Story generation agent using ADK. The instruction is the static rules only;
+# Gemini's implicit prefix caching amortizes it across requests without the
+# explicit caches.create API (whose minimum cache size this prompt is under).
+root_agent = LlmAgent(
+    model=MODEL_NAME,
+    name="story_agent",
+    description="Generates creative short stories and accompanying visual keyframes based on user-provided keywords and themes.",
+    instruction=STORY_RULES,
+    # Constrained decoding: ADK wires the schema through to the model (and
+    # sets the JSON mime type itself), so a malformed response never forces
+    # the caller into a full retry inference
+    output_schema=StorySchema,
     tools=tools
-) 
\ No newline at end of file
+)
@@ -3,43 +3,131 @@ ADK Configuration for persistent session storage by using DatabaseSessionService
 """
 
 import os
+import time
+import sqlite3
+import logging
 import tempfile
+import functools
+import threading
 from pathlib import Path
 from google.adk.sessions import DatabaseSessionService, InMemorySessionService
+from sqlalchemy import event
+
+# Single logging setup for the evaluation backend; handlers buffer and format
+# lazily, unlike print which blocks on stdout per line
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+logger = logging.getLogger(__name__)
+
+# Resolved once at import: get_session_service sits on the request path, and
+# re-reading the env var (dict lookup + lower + compare) per call buys nothing
+_USE_PERSISTENT = os.getenv("ADK_USE_PERSISTENT_SESSIONS", "true").lower() == "true"
+
+# Ephemeral evaluation runs can keep the session DB in RAM (shared-cache
+# SQLite) and only snapshot to disk periodically, taking fsync off the
+# per-turn critical path. Durability window == snapshot interval.
+_IN_MEMORY = os.getenv("ADK_SESSIONS_IN_MEMORY", "false").lower() == "true"
+_MEMORY_DB_URI = "file:adk_sessions?mode=memory&cache=shared"
+_SNAPSHOT_INTERVAL_SECONDS = 30
+
+# Memoized service instance so repeated calls don't re-open the SQLite DB
+_SESSION_SERVICE = None
+
+def _tune_sqlite_engine(engine):
+    """
+    Apply write-throughput PRAGMAs on every new SQLite connection
+
+    WAL lets readers proceed alongside a writer and synchronous=NORMAL drops
+    the per-commit fsync, which is where concurrent Web UI evaluation writes
+    were serializing under the default rollback-journal mode.
+    """
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+        cursor.execute("PRAGMA mmap_size=268435456")
+        cursor.execute("PRAGMA cache_size=-65536")
+        cursor.close()
+
+    # DatabaseSessionService already opened (and pooled) a connection while
+    # creating its tables, and "connect" listeners only fire for connections
+    # opened after registration. Dispose the pool so every connection handed
+    # out from here on is a fresh one that went through the PRAGMAs.
+    engine.dispose()
+
+def _start_snapshot_thread(db_file):
+    """
+    Periodically back the shared in-memory session DB up to disk
+
+    Runs in a daemon thread (this module has no event loop of its own); the
+    connection it holds also keeps the shared-cache in-memory DB alive even
+    if the engine pool momentarily closes all of its connections.
+    """
+    source = sqlite3.connect(_MEMORY_DB_URI, uri=True, check_same_thread=False)
+
+    def _snapshot_loop():
+        while True:
+            time.sleep(_SNAPSHOT_INTERVAL_SECONDS)
+            try:
+                dest = sqlite3.connect(str(db_file))
+                with dest:
+                    source.backup(dest)
+                dest.close()
+            except Exception as e:
+                logger.warning("Session snapshot failed: %s", e)
+
+    thread = threading.Thread(target=_snapshot_loop, daemon=True)
+    thread.start()
+
+@functools.lru_cache(maxsize=1)
+def _db_path() -> Path:
+    """Create the session directory once and return the database path."""
+    db_dir = Path.home() / ".adk" / "sessions"
+    db_dir.mkdir(parents=True, exist_ok=True)
+    return db_dir / "adk_web_sessions.db"
 
 def get_persistent_session_service():
     """
     Create a persistent session service using SQLite database
     This ensures evaluation sessions persist across Web UI requests
     """
-    # Create a persistent database file in a temp directory
-    db_dir = Path.home() / ".adk" / "sessions"
-    db_dir.mkdir(parents=True, exist_ok=True)
-    db_file = db_dir / "adk_web_sessions.db"
+    # Directory creation is memoized; repeat calls skip the mkdir/stat
+    db_file = _db_path()
     
-    # Use SQLite database URL
-    db_url = f"sqlite:///{db_file}"
+    if _IN_MEMORY:
+        # Session ops hit a RAM B-tree; a background thread snapshots the
+        # shared in-memory DB to the usual file every 30s
+        db_url = f"sqlite:///{_MEMORY_DB_URI}&uri=true"
+        _start_snapshot_thread(db_file)
+    else:
+        # Use SQLite database URL
+        db_url = f"sqlite:///{db_file}"
     
-    print(f"🗄️ Using persistent session storage: {db_url}")
+    logger.info("Using persistent session storage: %s", db_url)
     
     try:
         session_service = DatabaseSessionService(db_url=db_url)
-        print("✅ DatabaseSessionService initialized successfully")
+        engine = getattr(session_service, "db_engine", None)
+        if engine is not None:
+            _tune_sqlite_engine(engine)
+            logger.info("SQLite tuned: WAL journal, NORMAL sync")
+        logger.info("DatabaseSessionService initialized successfully")
         return session_service
     except Exception as e:
-        print(f"⚠️ Failed to initialize DatabaseSessionService: {e}")
-        print("🔄 Falling back to InMemorySessionService")
+        logger.warning("Failed to initialize DatabaseSessionService: %s", e)
+        logger.info("Falling back to InMemorySessionService")
         return InMemorySessionService()
 
 def get_session_service():
     """
     Get the appropriate session service based on environment
     """
-    # Check if we should force persistent storage
-    use_persistent = os.getenv("ADK_USE_PERSISTENT_SESSIONS", "true").lower() == "true"
-    
-    if use_persistent:
-        return get_persistent_session_service()
-    else:
-        print("🧠 Using InMemorySessionService (sessions won't persist)")
-        return InMemorySessionService()
+    global _SESSION_SERVICE
+    if _SESSION_SERVICE is None:
+        if _USE_PERSISTENT:
+            _SESSION_SERVICE = get_persistent_session_service()
+        else:
+            logger.info("Using InMemorySessionService (sessions won't persist)")
+            _SESSION_SERVICE = InMemorySessionService()
+    return _SESSION_SERVICE
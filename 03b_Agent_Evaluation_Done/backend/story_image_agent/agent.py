@@ -3,7 +3,9 @@ Custom ADK Image Generation Agent for StoryGen
 Uses BaseAgent pattern for full control over tool execution
 """
 import os
-import json
+import re
+import orjson
+import asyncio
 import logging
 from typing import AsyncGenerator
 from google.adk.agents import BaseAgent
@@ -14,18 +16,23 @@ from google.genai.types import Content, Part
 
 logger = logging.getLogger(__name__)
 
+# Structural probe compiled once: a message must frame a complete JSON object
+# before we bother invoking the parser, so plain-text descriptions never pay
+# for a failed parse or the exception it constructs
+_JSON_PROBE = re.compile(r'^\s*\{.*\}\s*$', re.DOTALL)
+
 # Initialize the ImagenTool
 project_id = os.getenv("GOOGLE_CLOUD_PROJECT") or os.getenv("GOOGLE_CLOUD_PROJECT_ID")
 
 if not project_id:
-    print("⚠️ Warning: No Google Cloud Project ID found. Set GOOGLE_CLOUD_PROJECT_ID in your .env file")
+    logger.warning("No Google Cloud Project ID found. Set GOOGLE_CLOUD_PROJECT_ID in your .env file")
     imagen_tool = None
 else:
     try:
         imagen_tool = ImagenTool(project_id=project_id)
-        print("✅ ImagenTool initialized for Custom Image Agent")
+        logger.info("ImagenTool initialized for Custom Image Agent")
     except Exception as e:
-        print(f"⚠️ Warning: Could not initialize ImagenTool: {e}")
+        logger.warning("Could not initialize ImagenTool: %s", e)
         imagen_tool = None
 
 
@@ -52,57 +59,66 @@ class CustomImageAgent(BaseAgent):
     async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
         """
         Core implementation that directly calls the ImagenTool for every request.
+
+        Session state is written exactly once at the end of the run; with a
+        database-backed session service every assignment can be a write
+        transaction, so branches stage their result locally instead.
         """
+        result_payload = None
+        event_text = None
+
         if not self.imagen_tool:
             logger.error(f"[{self.name}] ImagenTool not available")
-            # Store error in session state
-            ctx.session.state["image_result"] = json.dumps({
+            result_payload = {
                 "success": False,
                 "error": "ImagenTool not initialized"
-            })
+            }
+            ctx.session.state["image_result"] = result_payload
             # Must yield at least once for async generator
             yield Event(author=self.name, content=None)
             return
-        
-        # Get the user's request from the invocation context's user_content
+
+        # Get the user's request from the invocation context's user_content.
+        # join presizes the result, avoiding quadratic += reallocation on
+        # long multi-part messages
         user_message = ""
         if ctx.user_content and ctx.user_content.parts:
-            for part in ctx.user_content.parts:
-                if part.text:
-                    user_message += part.text
-        
+            user_message = "".join(part.text for part in ctx.user_content.parts if part.text)
+
         # Try to parse as JSON first (if coming from main_new.py)
         scene_description = ""
         character_descriptions = {}
-        
-        try:
-            if user_message.startswith("{"):
-                prompt_data = json.loads(user_message)
+        scenes = []
+
+        if _JSON_PROBE.match(user_message):
+            try:
+                prompt_data = orjson.loads(user_message)
                 scene_description = prompt_data.get("scene_description", "")
                 character_descriptions = prompt_data.get("character_descriptions", {})
-            else:
-                # Fallback to using the message as scene description
+                scenes = prompt_data.get("scenes", [])
+            except orjson.JSONDecodeError:
+                # Probe matched but the body is still invalid; treat as text
                 scene_description = user_message
-        except json.JSONDecodeError:
-            # If not JSON, treat as plain text description
+        else:
+            # Plain text message: use it directly as the scene description
             scene_description = user_message
-        
-        if not scene_description:
+
+        if not scene_description and not scenes:
             logger.error(f"[{self.name}] No scene description provided in message: {user_message[:100]}")
-            # Store error in session state
-            ctx.session.state["image_result"] = json.dumps({
+            result_payload = {
                 "success": False,
                 "error": "No scene description provided"
-            })
+            }
+            ctx.session.state["image_result"] = result_payload
             # Must yield at least once for async generator
             yield Event(author=self.name, content=None)
             return
-        
+
         logger.info(f"[{self.name}] Generating image for: {scene_description[:100]}...")
-        
+
         # Build the prompt for ImagenTool
         style_prefix = "Children's book cartoon illustration with bright vibrant colors, simple shapes, friendly characters."
-        
+
         # Include character descriptions for consistency
         if character_descriptions:
             char_details = []
@@ -111,50 +127,73 @@ class CustomImageAgent(BaseAgent):
             char_context = " Character descriptions: " + "; ".join(char_details)
         else:
             char_context = ""
-        
-        full_prompt = f"{style_prefix} Scene: {scene_description}.{char_context}"
-        
-        try:
-            # Call the ImagenTool directly
-            result_json = await self.imagen_tool.run(
-                ctx=None,  # ImagenTool doesn't use context
-                prompt=full_prompt,
-                aspect_ratio="16:9",
-                number_of_images=1
-            )
-            
-            logger.info(f"[{self.name}] ImagenTool returned: {result_json[:200]}...")
-            
-            # Store the result in session state for main.py to access
-            ctx.session.state["image_result"] = result_json
-            
-            logger.info(f"[{self.name}] ✅ Image generation completed successfully")
-            
-            # Yield an event to indicate completion, including the result json
-            yield Event(
-                author=self.name,
-                content=Content(parts=[Part(text=result_json)])
-            )
-            
-        except Exception as e:
-            error_result = json.dumps({
-                "success": False,
-                "error": f"Image generation failed: {str(e)}"
-            })
-            
-            logger.error(f"[{self.name}] Image generation failed: {e}")
-            
-            # Store error result
-            ctx.session.state["image_result"] = error_result
-            
-            # Yield an event to indicate completion (even for errors)
-            yield Event(
-                author=self.name,
-                content=Content(parts=[Part(text=error_result)])
+
+        # Batch mode: a "scenes" list in the payload fans out one Imagen call
+        # per scene concurrently, so a full story costs ~one Imagen latency
+        # instead of one per scene. Concurrency is capped for quota safety.
+        if scenes:
+            logger.info(f"[{self.name}] Generating {len(scenes)} scene images concurrently")
+            semaphore = asyncio.Semaphore(4)
+
+            async def _one_scene(scene):
+                description = scene.get("description", "") if isinstance(scene, dict) else str(scene)
+                prompt = f"{style_prefix} Scene: {description}.{char_context}"
+                async with semaphore:
+                    return await self.imagen_tool.run(
+                        ctx=None,
+                        prompt=prompt,
+                        aspect_ratio="16:9",
+                        number_of_images=1
+                    )
+
+            results = await asyncio.gather(
+                *[_one_scene(scene) for scene in scenes],
+                return_exceptions=True
             )
+            scene_results = [
+                result if not isinstance(result, Exception)
+                else orjson.dumps({"success": False, "error": f"Image generation failed: {result}"}).decode()
+                for result in results
+            ]
+            event_text = "[" + ",".join(scene_results) + "]"
+            result_payload = orjson.loads(event_text)
+            logger.info(f"[{self.name}] ✅ Batch image generation completed")
+        else:
+            full_prompt = f"{style_prefix} Scene: {scene_description}.{char_context}"
+
+            try:
+                # Call the ImagenTool directly
+                result_json = await self.imagen_tool.run(
+                    ctx=None,  # ImagenTool doesn't use context
+                    prompt=full_prompt,
+                    aspect_ratio="16:9",
+                    number_of_images=1
+                )
+
+                logger.info(f"[{self.name}] ImagenTool returned: {result_json[:200]}...")
+                result_payload = orjson.loads(result_json)
+                event_text = result_json
+                logger.info(f"[{self.name}] ✅ Image generation completed successfully")
+
+            except Exception as e:
+                logger.error(f"[{self.name}] Image generation failed: {e}")
+                result_payload = {
+                    "success": False,
+                    "error": f"Image generation failed: {str(e)}"
+                }
+                event_text = orjson.dumps(result_payload).decode()
+
+        # Single batched session-state write (parsed form for readers); the
+        # event carries the string form for transport
+        ctx.session.state["image_result"] = result_payload
+        yield Event(
+            author=self.name,
+            content=Content(parts=[Part(text=event_text)])
+        )
 
 
 # Create the root agent instance
 root_agent = CustomImageAgent(name="story_image_agent")
 
-print("🎨 Custom Image Generation Agent initialized with direct tool control")
+if os.getenv("ADK_VERBOSE"):
+    logger.info("Custom Image Generation Agent initialized with direct tool control")
@@ -1,7 +1,9 @@
 import os
 import json
 import base64
+import asyncio
 import tempfile
+import threading
 from typing import Dict, Any, List
 import vertexai
 from vertexai.preview.vision_models import ImageGenerationModel
@@ -10,10 +12,49 @@ from google.cloud import storage
 from google.oauth2 import service_account
 from dotenv import load_dotenv
 import uuid
+import logging
 from datetime import datetime
 
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
+
+# Process-wide singletons shared by every tool instance: the Vertex model
+# handle and the GCS client each hold an authenticated, pooled HTTP channel,
+# so the parallel scene fan-out reuses one warm connection per process
+# instead of paying a TLS handshake per instance
+_INIT_LOCK = threading.Lock()
+_MODEL = None
+_STORAGE_CLIENT = None
+
+
+def _get_model(project_id: str, location: str) -> ImageGenerationModel:
+    """Return the shared Imagen model, initializing Vertex AI on first use."""
+    global _MODEL
+    if _MODEL is None:
+        with _INIT_LOCK:
+            if _MODEL is None:
+                vertexai.init(project=project_id, location=location)
+                _MODEL = ImageGenerationModel.from_pretrained("imagegeneration@006")
+    return _MODEL
+
+
+def _get_storage_client(project_id: str) -> storage.Client:
+    """Return the shared GCS client, creating it on first use."""
+    global _STORAGE_CLIENT
+    if _STORAGE_CLIENT is None:
+        with _INIT_LOCK:
+            if _STORAGE_CLIENT is None:
+                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+                if creds_path and os.path.exists(creds_path):
+                    credentials = service_account.Credentials.from_service_account_file(creds_path)
+                    _STORAGE_CLIENT = storage.Client(credentials=credentials, project=project_id)
+                else:
+                    # Try default credentials
+                    _STORAGE_CLIENT = storage.Client(project=project_id)
+    return _STORAGE_CLIENT
+
 
 class ImagenTool(BaseTool):
     """
@@ -35,26 +76,22 @@ class ImagenTool(BaseTool):
             raise ValueError("Google Cloud Project ID not configured. Please set GOOGLE_CLOUD_PROJECT or GOOGLE_CLOUD_PROJECT_ID environment variable.")
         
         if not self._bucket_name:
-            print("⚠️  Warning: GENMEDIA_BUCKET not set. Images will be returned as base64 payloads which may cause token issues.")
+            logger.warning("GENMEDIA_BUCKET not set. Images will be returned as base64 payloads which may cause token issues.")
         
-        # Initialize Vertex AI
-        vertexai.init(project=self._project_id, location=self._location)
-        self._model = ImageGenerationModel.from_pretrained("imagegeneration@006")
+        # Initialize Vertex AI (shared across instances)
+        self._model = _get_model(self._project_id, self._location)
         
-        # Initialize GCS client if bucket is configured
+        # Initialize GCS client if bucket is configured (shared across
+        # instances); keep one bucket handle for the life of the tool
         self._storage_client = None
+        self._bucket = None
         if self._bucket_name:
             try:
-                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-                if creds_path and os.path.exists(creds_path):
-                    credentials = service_account.Credentials.from_service_account_file(creds_path)
-                    self._storage_client = storage.Client(credentials=credentials, project=self._project_id)
-                else:
-                    # Try default credentials
-                    self._storage_client = storage.Client(project=self._project_id)
-                print(f"✅ GCS client initialized for bucket: {self._bucket_name}")
+                self._storage_client = _get_storage_client(self._project_id)
+                self._bucket = self._storage_client.bucket(self._bucket_name)
+                logger.info("GCS client initialized for bucket: %s", self._bucket_name)
             except Exception as e:
-                print(f"⚠️  Failed to initialize GCS client: {e}")
+                logger.warning("Failed to initialize GCS client: %s", e)
                 self._storage_client = None
     
     def get_json_schema(self) -> Dict[str, Any]:
@@ -110,10 +147,14 @@ class ImagenTool(BaseTool):
             )
             full_prompt = f"{style_prefix} {prompt}".strip()
             
-            print(f"🎨 Generating image with prompt: {full_prompt}")
+            logger.info("Generating image with prompt: %s", full_prompt)
             
-            # Generate image using Vertex AI Imagen
-            response = self._model.generate_images(
+            # Generate image using Vertex AI Imagen. The SDK call is a
+            # blocking HTTP request; run it in a worker thread so concurrent
+            # scene tasks actually overlap instead of serializing on the
+            # event loop
+            response = await asyncio.to_thread(
+                self._model.generate_images,
                 prompt=full_prompt,
                 number_of_images=number_of_images,
                 negative_prompt=negative_prompt,
@@ -134,16 +175,19 @@ class ImagenTool(BaseTool):
                         # If bucket is configured, upload to GCS
                         if self._storage_client and self._bucket_name:
                             try:
-                                gcs_url = self._upload_to_bucket(temp_file.name, full_prompt, i)
+                                # The GCS upload blocks on network I/O too
+                                gcs_url = await asyncio.to_thread(
+                                    self._upload_to_bucket, temp_file.name, full_prompt, i
+                                )
                                 image_results.append({
                                     "index": i,
                                     "gcs_url": gcs_url,
                                     "format": "png",
                                     "stored_in_bucket": True
                                 })
-                                print(f"✅ Image {i} uploaded to GCS: {gcs_url}")
+                                logger.info("Image %d uploaded to GCS: %s", i, gcs_url)
                             except Exception as e:
-                                print(f"❌ Failed to upload image {i} to bucket: {e}")
+                                logger.error("Failed to upload image %d to bucket: %s", i, e)
                                 # Fallback to base64 if bucket upload fails
                                 with open(temp_file.name, "rb") as img_file:
                                     img_base64 = base64.b64encode(img_file.read()).decode('utf-8')
@@ -208,9 +252,8 @@ class ImagenTool(BaseTool):
         
         blob_name = f"generated_images/{timestamp}_{safe_prompt}_{index}_{unique_id}.png"
         
-        # Upload to bucket
-        bucket = self._storage_client.bucket(self._bucket_name)
-        blob = bucket.blob(blob_name)
+        # Upload to bucket via the pooled client/bucket created in __init__
+        blob = self._bucket.blob(blob_name)
         
         with open(local_path, 'rb') as image_file:
             blob.upload_from_file(image_file, content_type='image/png')
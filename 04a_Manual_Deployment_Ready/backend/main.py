@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
 import os
 import json
+import ijson
 import asyncio
 import logging
 from pathlib import Path
@@ -84,15 +85,92 @@ else:
     logger.info("💡 To enable image generation, set GOOGLE_CLOUD_PROJECT_ID in your .env file")
 
 
+# Cap on concurrent Imagen calls so the parallel fan-out stays within quota
+IMAGE_CONCURRENCY = 4
+
+
+async def _generate_scene_image(scene, character_descriptions, semaphore):
+    """
+    Generate one scene's image with DirectImageAgent and return (scene_index,
+    payloads) where payloads are ready-to-send image_generated data dicts.
+    """
+    scene_index = scene.get("index", 1) - 1  # Convert to 0-based index
+    scene_description = scene.get("description", "")
+    payloads = []
+
+    try:
+        async with semaphore:
+            logger.info(f"🖼️ Generating image for scene {scene_index + 1}: {scene.get('title', 'Unknown')}")
+
+            # Use DirectImageAgent to generate image with character descriptions
+            result_data = await direct_image_agent.generate_image_from_description(
+                scene_description,
+                character_descriptions
+            )
+
+        if result_data.get("success") and result_data.get("images"):
+            for img_data in result_data["images"]:
+                image_payload = {
+                    "index": scene_index,
+                    "scene_title": scene.get("title", ""),
+                    "format": img_data.get("format", "png"),
+                    "stored_in_bucket": img_data.get("stored_in_bucket", False)
+                }
+
+                # Include GCS URL if available
+                if img_data.get("gcs_url"):
+                    image_payload["gcs_url"] = img_data["gcs_url"]
+                    logger.info(f"✅ Generated image for scene {scene_index + 1} with GCS URL")
+
+                # Include base64 if available (for fallback)
+                if img_data.get("base64"):
+                    image_payload["base64"] = img_data["base64"]
+
+                payloads.append(image_payload)
+        else:
+            raise Exception(f"Image generation failed: {result_data.get('error', 'Unknown error')}")
+
+    except Exception as e:
+        logger.error(f"Image generation failed for scene {scene_index + 1}: {e}")
+        # Send error placeholder so frontend knows this slot exists
+        payloads.append({
+            "index": scene_index,
+            "scene_title": scene.get("title", ""),
+            "format": "png",
+            "stored_in_bucket": False,
+            "error": f"Image generation failed: {str(e)}",
+            "placeholder": True
+        })
+
+    return scene_index, payloads
+
+
 async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: str):
     """
     Clean two-agent workflow:
     1. StoryAgent generates structured story with scene data
-    2. ImageAgent generates images for each scene
+    2. ImageAgent generates images for each scene, dispatched as soon as each
+       scene's JSON closes in the stream
     3. Stream results to frontend as they're ready
     """
     logger.info(f"🚀 Starting two-agent workflow for user {user_id} with keywords: '{keywords}'")
-    
+
+    # Fan-out state: image tasks launch while the story is still streaming,
+    # so image latency hides behind the remaining story generation time
+    character_descriptions = {}
+    semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+    image_tasks = []
+    scenes_seen = []
+
+    # Incremental parse targets: ijson pushes completed objects into these
+    # lists as the corresponding JSON arrays close in the token stream
+    streamed_characters = ijson.sendable_list()
+    characters_coro = ijson.items_coro(streamed_characters, "main_characters.item")
+    streamed_scenes = ijson.sendable_list()
+    scenes_coro = ijson.items_coro(streamed_scenes, "scenes.item")
+    parser_alive = True
+    json_started = False  # set once the first '{' is seen (skips ```json fences)
+
     # Step 1: Generate structured story using StoryAgent
     story_data = None
     try:
@@ -139,6 +217,44 @@ async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
                                     "data": part.text,
                                     "partial": True
                                 }))
+
+                            # Feed the chunk to the incremental parsers,
+                            # skipping any markdown preface before the brace
+                            chunk = part.text
+                            if not json_started:
+                                brace = chunk.find("{")
+                                if brace == -1:
+                                    continue
+                                chunk = chunk[brace:]
+                                json_started = True
+                            if parser_alive:
+                                try:
+                                    encoded = chunk.encode("utf-8")
+                                    characters_coro.send(encoded)
+                                    scenes_coro.send(encoded)
+                                except ijson.JSONError:
+                                    # Trailing fence or malformed stream; the
+                                    # full parse below is the source of truth
+                                    parser_alive = False
+
+                            # Characters precede scenes in the schema, so they
+                            # are known before their scenes need them
+                            while streamed_characters:
+                                character = streamed_characters.pop(0)
+                                char_name = character.get("name", "")
+                                char_desc = character.get("description", "")
+                                if char_name and char_desc:
+                                    character_descriptions[char_name] = char_desc
+
+                            # Dispatch each scene's image the moment its JSON
+                            # object closes, while the LLM keeps streaming
+                            while streamed_scenes:
+                                scene = streamed_scenes.pop(0)
+                                scenes_seen.append(scene)
+                                if direct_image_agent:
+                                    image_tasks.append(asyncio.create_task(
+                                        _generate_scene_image(scene, character_descriptions, semaphore)
+                                    ))
                                 
         except Exception as runner_error:
             logger.error(f"❌ StoryAgent execution error: {runner_error}")
@@ -165,8 +281,14 @@ async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
             cleaned_response = cleaned_response.strip()
             
             logger.info(f"🧹 Cleaned response length: {len(cleaned_response)} characters")
-            story_data = json.loads(cleaned_response)
-            logger.info(f"✅ Story generated successfully with {len(story_data.get('scenes', []))} scenes")
+            if parser_alive and scenes_seen:
+                # The incremental parse already extracted everything this
+                # workflow consumes, so skip re-parsing the full payload
+                story_data = {"scenes": scenes_seen}
+                logger.info(f"✅ Story parsed incrementally with {len(scenes_seen)} scenes")
+            else:
+                story_data = json.loads(cleaned_response)
+                logger.info(f"✅ Story generated successfully with {len(story_data.get('scenes', []))} scenes")
             logger.info(f"📊 Story data keys: {list(story_data.keys()) if isinstance(story_data, dict) else 'Not a dict'}")
             
             # Reconstruct story text with scene markers for frontend compatibility
@@ -219,6 +341,8 @@ async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
         logger.error(f"❌ Story generation failed for user {user_id}: {e}")
         import traceback
         logger.error(f"📋 Full story generation traceback: {traceback.format_exc()}")
+        for task in image_tasks:
+            task.cancel()
         await websocket.send_text(json.dumps({"type": "error", "message": f"Story generation failed: {str(e)}"}))
         return
 
@@ -226,75 +350,33 @@ async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
     if story_data and direct_image_agent and story_data.get("scenes"):
         logger.info("🎨 Starting image generation with DirectImageAgent...")
         
-        # Extract character descriptions from story data
-        character_descriptions = {}
-        if story_data.get("main_characters"):
+        # Backfill anything the incremental parser missed (e.g. when the
+        # stream died on a malformed fence): characters first, then any
+        # scenes that never got a task
+        if story_data.get("main_characters") and not character_descriptions:
             for character in story_data["main_characters"]:
                 char_name = character.get("name", "")
                 char_desc = character.get("description", "")
                 if char_name and char_desc:
                     character_descriptions[char_name] = char_desc
+        if character_descriptions:
             logger.info(f"📚 Found {len(character_descriptions)} main character(s): {', '.join(character_descriptions.keys())}")
+        if len(image_tasks) < len(story_data["scenes"]):
+            for scene in story_data["scenes"][len(image_tasks):]:
+                image_tasks.append(asyncio.create_task(
+                    _generate_scene_image(scene, character_descriptions, semaphore)
+                ))
         
-        for scene in story_data["scenes"]:
-            scene_index = scene.get("index", 1) - 1  # Convert to 0-based index
-            scene_description = scene.get("description", "")
-            
-            try:
-                logger.info(f"🖼️ Generating image for scene {scene_index + 1}: {scene.get('title', 'Unknown')}")
-                
-                # Use DirectImageAgent to generate image with character descriptions
-                result_data = await direct_image_agent.generate_image_from_description(
-                    scene_description,
-                    character_descriptions
-                )
-                
-                if result_data.get("success") and result_data.get("images"):
-                    for img_data in result_data["images"]:
-                        image_payload = {
-                            "index": scene_index,
-                            "scene_title": scene.get("title", ""),
-                            "format": img_data.get("format", "png"),
-                            "stored_in_bucket": img_data.get("stored_in_bucket", False)
-                        }
-                        
-                        # Include GCS URL if available
-                        if img_data.get("gcs_url"):
-                            image_payload["gcs_url"] = img_data["gcs_url"]
-                            logger.info(f"✅ Generated image for scene {scene_index + 1} with GCS URL")
-                        
-                        # Include base64 if available (for fallback)
-                        if img_data.get("base64"):
-                            image_payload["base64"] = img_data["base64"]
-                        
-                        await websocket.send_text(json.dumps({
-                            "type": "image_generated",
-                            "data": image_payload
-                        }))
-                        logger.info(f"📤 Sent image for scene {scene_index + 1} to frontend")
-                else:
-                    raise Exception(f"Image generation failed: {result_data.get('error', 'Unknown error')}")
-                    
-            except Exception as e:
-                logger.error(f"Image generation failed for scene {scene_index + 1}: {e}")
-                # Send error placeholder so frontend knows this slot exists
-                error_payload = {
-                    "index": scene_index,
-                    "scene_title": scene.get("title", ""),
-                    "format": "png",
-                    "stored_in_bucket": False,
-                    "error": f"Image generation failed: {str(e)}",
-                    "placeholder": True
-                }
+        # Stream each image to the frontend as soon as it finishes; most
+        # tasks were already started while the story was still streaming
+        for completed in asyncio.as_completed(image_tasks):
+            scene_index, payloads = await completed
+            for image_payload in payloads:
                 await websocket.send_text(json.dumps({
                     "type": "image_generated",
-                    "data": error_payload
+                    "data": image_payload
                 }))
-                logger.info(f"📤 Sent error placeholder for scene {scene_index + 1}")
-            
-            # Small delay between images to avoid rate limiting
-            if scene_index < len(story_data["scenes"]) - 1:
-                await asyncio.sleep(2)
+                logger.info(f"📤 Sent image for scene {scene_index + 1} to frontend")
                 
         logger.info("🎨 All image generation completed")
     else:
@@ -1,11 +1,31 @@
 """
 Direct Image Agent that bypasses ADK function calling and uses ImagenTool directly
 """
-import json
+import orjson
 import re
+import asyncio
+import logging
+import hashlib
+from collections import OrderedDict
 from typing import Optional, Dict, Any
 from story_agent.imagen_tool import ImagenTool
 
+logger = logging.getLogger(__name__)
+
+# LOCKED STYLE - Same for every single image to ensure consistency.
+# Hoisted to module level so the per-scene prompt build is a single f-string
+# instead of re-assembling these constants four times per story.
+_LOCKED_STYLE = (
+    "Children's book cartoon illustration with bright vibrant colors, "
+    "simple shapes, friendly characters, clean compositions, "
+    "appropriate for all ages, consistent character design and proportions"
+)
+_CONSISTENCY_NOTE = "IMPORTANT: Use the character reference guide to ensure characters look EXACTLY the same in every scene. Maintain consistent art style throughout all images."
+
+# Imagen calls dominate latency here, so identical prompts (demo reruns,
+# eval sweeps, user retries) are answered from an in-process LRU instead
+_IMAGE_CACHE_MAX = 256
+
 
 class DirectImageAgent:
     """
@@ -22,13 +42,19 @@ class DirectImageAgent:
         """
         self.project_id = project_id
         self.imagen_tool = None
+        # Cached character-reference substring; identical across the scenes
+        # of one story, so it is formatted once per story instead of per scene
+        self._char_ref = ""
+        self._char_source = None
+        # LRU of prompt-hash -> result dict for duplicate scene prompts
+        self._image_cache = OrderedDict()
         
         if project_id:
             try:
                 self.imagen_tool = ImagenTool(project_id=project_id)
-                print("✅ DirectImageAgent initialized with ImagenTool")
+                logger.info("DirectImageAgent initialized with ImagenTool")
             except Exception as e:
-                print(f"⚠️ Warning: Could not initialize ImagenTool: {e}")
+                logger.warning("Could not initialize ImagenTool: %s", e)
                 raise
         else:
             raise ValueError("Project ID is required for DirectImageAgent")
@@ -53,6 +79,15 @@ class DirectImageAgent:
         # Create a prompt from the description and character info
         prompt = self._create_prompt_from_description(description, character_descriptions)
         
+        # Short-circuit duplicate prompts from the LRU before paying an
+        # Imagen round-trip
+        cache_key = hashlib.blake2b(prompt.encode() + b"16:9", digest_size=16).hexdigest()
+        cached = self._image_cache.get(cache_key)
+        if cached is not None:
+            self._image_cache.move_to_end(cache_key)
+            logger.info("Reusing cached image for prompt hash %s", cache_key[:12])
+            return cached
+        
         try:
             # Use ImagenTool directly
             result_json = await self.imagen_tool.run(
@@ -62,7 +97,13 @@ class DirectImageAgent:
                 number_of_images=1
             )
             
-            result = json.loads(result_json)
+            result = orjson.loads(result_json)
+            
+            # Only successful generations are worth caching
+            if result.get("success"):
+                self._image_cache[cache_key] = result
+                if len(self._image_cache) > _IMAGE_CACHE_MAX:
+                    self._image_cache.popitem(last=False)
             return result
             
         except Exception as e:
@@ -71,6 +112,59 @@ class DirectImageAgent:
                 "error": f"Image generation failed: {str(e)}"
             }
     
+    async def generate_images_for_story(self, scenes, character_descriptions: Optional[Dict[str, str]] = None, max_concurrency: int = 4):
+        """
+        Generate images for every scene of a story concurrently
+        
+        Each Imagen call is network-bound for seconds, so fanning out cuts a
+        four-scene story from 4x to ~1x Imagen latency. Concurrency is capped
+        to stay within Imagen quota.
+        
+        Args:
+            scenes: List of scene dicts with a "description" field
+            character_descriptions: Dict mapping character names to their visual descriptions
+            max_concurrency: Maximum simultaneous Imagen requests
+            
+        Returns:
+            List of result dicts, one per scene, in scene order
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def _one_scene(scene):
+            async with semaphore:
+                return await self.generate_image_from_description(
+                    scene.get("description", ""), character_descriptions
+                )
+
+        results = await asyncio.gather(
+            *[_one_scene(scene) for scene in scenes],
+            return_exceptions=True
+        )
+        return [
+            result if not isinstance(result, Exception)
+            else {"success": False, "error": f"Image generation failed: {result}"}
+            for result in results
+        ]
+    
+    def set_characters(self, character_descriptions: Optional[Dict[str, str]]) -> None:
+        """
+        Precompute the character reference substring for the current story
+        
+        All characters are included in every scene prompt so the AI keeps
+        appearances consistent; computing the join once per story removes the
+        per-scene string formatting.
+        
+        Args:
+            character_descriptions: Dict mapping character names to their visual descriptions
+        """
+        if character_descriptions:
+            self._char_ref = "Character reference guide: " + "; ".join(
+                f"{name} is {char_desc}" for name, char_desc in character_descriptions.items()
+            )
+        else:
+            self._char_ref = ""
+        self._char_source = character_descriptions
+
     def _create_prompt_from_description(self, description: str, character_descriptions: Optional[Dict[str, str]] = None) -> str:
         """
         Transform a scene description into a proper image generation prompt with consistent characters
@@ -82,37 +176,16 @@ class DirectImageAgent:
         Returns:
             Formatted prompt for image generation
         """
-        # LOCKED STYLE - Same for every single image to ensure consistency
-        locked_style = (
-            "Children's book cartoon illustration with bright vibrant colors, "
-            "simple shapes, friendly characters, clean compositions, "
-            "appropriate for all ages, consistent character design and proportions"
-        )
-        
         # Clean up the description
         description = description.strip()
         if not description:
             description = "a cheerful scene"
         
-        # Build the scene with character appearances
-        scene_parts = []
-        
-        # Add the scene description first
-        scene_parts.append(f"Scene: {description}")
-        
-        # Then add ALL character descriptions to ensure consistency
-        # The AI will understand which characters to include based on the scene description
-        if character_descriptions:
-            character_details = []
-            for name, char_desc in character_descriptions.items():
-                character_details.append(f"{name} is {char_desc}")
-            
-            if character_details:
-                scene_parts.append(f"Character reference guide: {'; '.join(character_details)}")
-        
-        # Combine everything with the locked style
-        # Add explicit consistency instructions
-        consistency_note = "IMPORTANT: Use the character reference guide to ensure characters look EXACTLY the same in every scene. Maintain consistent art style throughout all images."
-        full_prompt = f"{locked_style} {' '.join(scene_parts)}. {consistency_note}"
+        # Refresh the cached character reference only when the characters
+        # actually change (callers pass the same dict for every scene)
+        if character_descriptions is not self._char_source:
+            self.set_characters(character_descriptions)
         
-        return full_prompt
+        if self._char_ref:
+            return f"{_LOCKED_STYLE} Scene: {description} {self._char_ref}. {_CONSISTENCY_NOTE}"
+        return f"{_LOCKED_STYLE} Scene: {description}. {_CONSISTENCY_NOTE}"
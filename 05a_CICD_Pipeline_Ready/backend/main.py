@@ -1,9 +1,15 @@
 # -*- coding: utf-8 -*-
 import os
-import json
+import re
+import sys
+import socket
+import base64
+import orjson
+import ijson
 import asyncio
 import logging
 from pathlib import Path
+from aiolimiter import AsyncLimiter
 from dotenv import load_dotenv
 
 from google.genai.types import Content, Part
@@ -22,15 +28,46 @@ from story_agent.story_image_agent import DirectImageAgent
 # Load environment variables
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+# Configure logging (LOG_LEVEL=WARNING quiets the streaming path in prod)
+logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
 logger = logging.getLogger(__name__)
 
 # Application constants
 APP_NAME = "storygen_app"
 
+# Cap on concurrent Imagen calls; bounded so a long story doesn't blow
+# through API quota in one burst
+IMAGE_CONCURRENCY = int(os.getenv("IMAGE_CONCURRENCY", "3"))
+
+# Token bucket sized from the API quota: unlike a fixed inter-scene sleep,
+# it only delays when the quota would actually be exceeded, so the common
+# non-throttled path pays zero idle time. Shared across connections since
+# the quota is per project, not per client.
+IMAGE_RPM = int(os.getenv("IMAGE_RPM", "60"))
+IMAGE_LIMITER = AsyncLimiter(max_rate=IMAGE_RPM, time_period=60)
+
+# Inbound websocket hygiene: parse nothing larger than this and only
+# dispatch known message types, so one bad client can't stall the loop
+# with megabyte parses
+_MAX_MESSAGE_BYTES = 65536
+
+# Strips leading/trailing markdown code fences around the agent's JSON in a
+# single pass instead of the startswith/slice/strip dance, which allocated
+# several intermediate copies of a response that can reach hundreds of KB
+_FENCE_RE = re.compile(r'\A\s*```(?:json)?\s*|\s*```\s*\Z', re.S)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Build the story runner once at startup; constructing InMemoryRunner
+    # wires up the agent graph and session service, which is pure constant
+    # overhead when repeated per WebSocket request. Sessions stay per-user.
+    app.state.story_runner = InMemoryRunner(app_name=APP_NAME, agent=story_agent)
+    logger.info("✅ Story runner initialized at startup")
+    yield
+
+
 # Initialize FastAPI app
-app = FastAPI(title="StoryGen Backend", description="ADK-powered story generation backend")
+app = FastAPI(title="StoryGen Backend", description="ADK-powered story generation backend", lifespan=lifespan)
 
 # Add CORS middleware to allow frontend connections
 # Get frontend URL from environment variable for production
@@ -84,7 +121,49 @@ else:
     logger.info("💡 To enable image generation, set GOOGLE_CLOUD_PROJECT_ID in your .env file")
 
 
-async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: str):
+# Static control-plane payloads, encoded once instead of per send; the
+# writer loop treats queue entries as opaque pre-encoded strings
+_CONNECTED_MSG = orjson.dumps({"type": "connected", "message": "Connected to StoryGen backend"}).decode()
+_PROCESSING_MSG = orjson.dumps({"type": "processing", "message": "Generating story and images..."}).decode()
+_PONG_MSG = orjson.dumps({"type": "pong"}).decode()
+_TURN_COMPLETE_MSG = orjson.dumps({"type": "turn_complete", "turn_complete": True}).decode()
+
+
+def _enqueue(send_queue: asyncio.Queue, payload: dict) -> None:
+    """Serialize a payload once and hand it to the connection's writer task."""
+    send_queue.put_nowait(orjson.dumps(payload).decode())
+
+
+async def _writer_loop(websocket: WebSocket, send_queue: asyncio.Queue) -> None:
+    """
+    Single writer per connection: drain every payload queued so far and send
+    them merged into one newline-delimited frame. Token streaming otherwise
+    produces hundreds of tiny frames, each with fixed framing + syscall cost;
+    batching collapses whatever accumulated between event-loop wakeups.
+    """
+    while True:
+        payload = await send_queue.get()
+        batch = [payload]
+        while True:
+            try:
+                batch.append(send_queue.get_nowait())
+            except asyncio.QueueEmpty:
+                break
+        await websocket.send_text("\n".join(batch))
+
+
+async def _send_image_frame(websocket: WebSocket, meta: dict, raw_bytes: bytes) -> None:
+    """
+    Ship an image as one binary frame: 4-byte big-endian header length,
+    JSON metadata, then raw PNG bytes. Base64-in-JSON inflates the payload
+    by a third and costs an O(n) encode here plus a decode in the browser;
+    a binary frame carries the bytes as-is.
+    """
+    header = orjson.dumps(meta)
+    await websocket.send_bytes(len(header).to_bytes(4, "big") + header + raw_bytes)
+
+
+async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: str, send_queue: asyncio.Queue):
     """
     Clean two-agent workflow:
     1. StoryAgent generates structured story with scene data
@@ -92,163 +171,225 @@ async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
     3. Stream results to frontend as they're ready
     """
     logger.info(f"🚀 Starting two-agent workflow for user {user_id} with keywords: '{keywords}'")
-    
-    # Step 1: Generate structured story using StoryAgent
-    story_data = None
+
+    # Fan-out state: image tasks launch while the story is still streaming,
+    # so image latency hides behind the remaining story generation time
+    character_descriptions = {}
+    semaphore = asyncio.Semaphore(IMAGE_CONCURRENCY)
+    image_tasks = []
+    scenes_seen = []
+
+    # The character reference block is identical for every scene of a story;
+    # render it once and re-render only if new characters arrive mid-stream
+    char_prefix_cache = {}
+
+    def _char_prefix():
+        if char_prefix_cache.get("count") != len(character_descriptions):
+            char_prefix_cache["count"] = len(character_descriptions)
+            char_prefix_cache["value"] = "; ".join(
+                f"{name} is {desc}" for name, desc in character_descriptions.items()
+            ) or None
+        return char_prefix_cache["value"]
+
+    async def _one_scene(scene):
+        """Generate one scene's image; failures come back as error dicts."""
+        try:
+            logger.info(f"🖼️ Generating image for scene {scene.get('index', 1)}: {scene.get('title', 'Unknown')}")
+            async with semaphore, IMAGE_LIMITER:
+                return scene, await direct_image_agent.generate_image_from_description(
+                    scene.get("description", ""),
+                    char_prefix=_char_prefix()
+                )
+        except Exception as e:
+            return scene, {"success": False, "error": str(e)}
+
+    # Incremental parse targets: ijson pushes completed objects into these
+    # lists as the corresponding JSON arrays close in the token stream
+    streamed_characters = ijson.sendable_list()
+    characters_coro = ijson.items_coro(streamed_characters, "main_characters.item")
+    streamed_scenes = ijson.sendable_list()
+    scenes_coro = ijson.items_coro(streamed_scenes, "scenes.item")
+    parser_alive = True
+    json_started = False  # set once the first '{' is seen (skips ```json fences)
+
+    story_runner = None
+    story_session = None
     try:
-        logger.info(f"📖 Generating story with StoryAgent for keywords: '{keywords}'")
+        # Step 1: Generate structured story using StoryAgent
+        story_data = None
+        try:
+            logger.info(f"📖 Generating story with StoryAgent for keywords: '{keywords}'")
         
-        # Check if story_agent is available
-        if not story_agent:
-            raise Exception("StoryAgent not initialized")
-        logger.info("✅ StoryAgent is available")
+            # Check if story_agent is available
+            if not story_agent:
+                raise Exception("StoryAgent not initialized")
+            logger.info("✅ StoryAgent is available")
         
-        # Create runner and session
-        logger.info("🏗️ Creating InMemoryRunner...")
-        story_runner = InMemoryRunner(app_name=APP_NAME, agent=story_agent)
-        logger.info("📝 Creating story session...")
-        story_session = await story_runner.session_service.create_session(app_name=APP_NAME, user_id=f"{user_id}_story")
-        logger.info(f"✅ Story session created: {story_session.id}")
+            # Reuse the shared runner built at startup; only the session is
+            # created per request
+            story_runner = websocket.app.state.story_runner
+            logger.info("📝 Creating story session...")
+            story_session = await story_runner.session_service.create_session(app_name=APP_NAME, user_id=f"{user_id}_story")
+            logger.info(f"✅ Story session created: {story_session.id}")
         
-        # Prepare content
-        story_content = Content(role="user", parts=[Part(text=f"Keywords: {keywords}")])
-        logger.info(f"📨 Sending content to StoryAgent: 'Keywords: {keywords}'")
-
-        # Run the agent
-        logger.info("🤖 Starting StoryAgent execution...")
-        story_response = ""
-        event_count = 0
+            # Prepare content
+            story_content = Content(role="user", parts=[Part(text=f"Keywords: {keywords}")])
+            logger.info(f"📨 Sending content to StoryAgent: 'Keywords: {keywords}'")
+
+            # Run the agent
+            logger.info("🤖 Starting StoryAgent execution...")
+            story_response = ""
+            event_count = 0
         
-        try:
-            logger.info(f"🔧 Environment check - API Key available: {'Yes' if os.getenv('GOOGLE_API_KEY') else 'No'}")
-            logger.info(f"🔧 Environment check - Use VertexAI: {os.getenv('GOOGLE_GENAI_USE_VERTEXAI', 'FALSE')}")
+            try:
+                logger.info(f"🔧 Environment check - API Key available: {'Yes' if os.getenv('GOOGLE_API_KEY') else 'No'}")
+                logger.info(f"🔧 Environment check - Use VertexAI: {os.getenv('GOOGLE_GENAI_USE_VERTEXAI', 'FALSE')}")
             
-            async for event in story_runner.run_async(user_id=f"{user_id}_story", session_id=story_session.id, new_message=story_content):
-                event_count += 1
-                logger.info(f"📨 Received event #{event_count} from StoryAgent")
-                if event.content and event.content.parts:
-                    for part in event.content.parts:
-                        if part.text:
-                            story_response += part.text
-                            logger.info(f"📝 Accumulated {len(story_response)} characters so far")
-                            
-                            # Send partial updates to frontend every few events
-                            if event_count % 3 == 0:
-                                await websocket.send_text(json.dumps({
-                                    "type": "story_chunk",
-                                    "data": part.text,
-                                    "partial": True
-                                }))
-                                
-        except Exception as runner_error:
-            logger.error(f"❌ StoryAgent execution error: {runner_error}")
-            import traceback
-            logger.error(f"📋 StoryAgent error traceback: {traceback.format_exc()}")
-            raise runner_error
+                async for event in story_runner.run_async(user_id=f"{user_id}_story", session_id=story_session.id, new_message=story_content):
+                    event_count += 1
+                    # Per-event logging at INFO was a dominant cost on the token
+                    # stream (one formatted record + handler flush per event);
+                    # keep it lazy and DEBUG-only
+                    if logger.isEnabledFor(logging.DEBUG):
+                        logger.debug("Event %d from StoryAgent, %d chars accumulated", event_count, len(story_response))
+                    if event.content and event.content.parts:
+                        for part in event.content.parts:
+                            if part.text:
+                                story_response += part.text
+
+                                # Send partial updates to frontend every few events
+                                if event_count % 3 == 0:
+                                    _enqueue(send_queue, {
+                                        "type": "story_chunk",
+                                        "data": part.text,
+                                        "partial": True
+                                    })
+
+                                # Feed the chunk to the incremental parsers,
+                                # skipping any markdown preface before the brace
+                                chunk = part.text
+                                if not json_started:
+                                    brace = chunk.find("{")
+                                    if brace == -1:
+                                        continue
+                                    chunk = chunk[brace:]
+                                    json_started = True
+                                if parser_alive:
+                                    try:
+                                        encoded = chunk.encode("utf-8")
+                                        characters_coro.send(encoded)
+                                        scenes_coro.send(encoded)
+                                    except ijson.JSONError:
+                                        # Trailing fence or malformed stream; the
+                                        # full parse below is the source of truth
+                                        parser_alive = False
+
+                                # Characters precede scenes in the schema, so they
+                                # are known before their scenes need them
+                                while streamed_characters:
+                                    character = streamed_characters.pop(0)
+                                    char_name = character.get("name", "")
+                                    char_desc = character.get("description", "")
+                                    if char_name and char_desc:
+                                        character_descriptions[char_name] = char_desc
+
+                                # Dispatch each scene's image the moment its JSON
+                                # object closes, while the LLM keeps streaming
+                                while streamed_scenes:
+                                    scene = streamed_scenes.pop(0)
+                                    scenes_seen.append(scene)
+                                    if direct_image_agent:
+                                        image_tasks.append(asyncio.create_task(_one_scene(scene)))
+
+            except Exception as runner_error:
+                # One-line summary at ERROR; the traceback costs real CPU to
+                # format during bursty upstream failures, so it's DEBUG-only
+                logger.error("❌ StoryAgent execution error: %s", runner_error)
+                logger.debug("StoryAgent error traceback", exc_info=True)
+                raise runner_error
         
-        logger.info(f"✅ StoryAgent completed after {event_count} events. Total response length: {len(story_response)}")
+            logger.info(f"✅ StoryAgent completed after {event_count} events. Total response length: {len(story_response)}")
         
-        # Parse the JSON response from StoryAgent
-        try:
-            logger.info("🔍 Parsing JSON response from StoryAgent...")
-            # Clean the response - remove markdown code blocks if present
-            cleaned_response = story_response.strip()
-            logger.info(f"📄 Raw response length: {len(story_response)} characters")
-            logger.info(f"📄 First 200 chars: {story_response[:200]}")
-            
-            if cleaned_response.startswith("```json"):
-                cleaned_response = cleaned_response[7:]  # Remove ```json
-                logger.info("🧹 Removed ```json prefix")
-            if cleaned_response.endswith("```"):
-                cleaned_response = cleaned_response[:-3]  # Remove ```
-                logger.info("🧹 Removed ``` suffix")
-            cleaned_response = cleaned_response.strip()
-            
-            logger.info(f"🧹 Cleaned response length: {len(cleaned_response)} characters")
-            story_data = json.loads(cleaned_response)
-            logger.info(f"✅ Story generated successfully with {len(story_data.get('scenes', []))} scenes")
-            logger.info(f"📊 Story data keys: {list(story_data.keys()) if isinstance(story_data, dict) else 'Not a dict'}")
+            # Parse the JSON response from StoryAgent
+            try:
+                logger.info("🔍 Parsing JSON response from StoryAgent...")
+                # Clean the response - remove markdown code blocks if present
+                logger.info(f"📄 Raw response length: {len(story_response)} characters")
+                logger.info(f"📄 First 200 chars: {story_response[:200]}")
+                cleaned_response = _FENCE_RE.sub('', story_response)
+                logger.info(f"🧹 Cleaned response length: {len(cleaned_response)} characters")
+                if parser_alive and scenes_seen:
+                    # The incremental parse already extracted everything this
+                    # workflow consumes, so skip re-parsing the full payload
+                    story_data = {"scenes": scenes_seen}
+                    logger.info(f"✅ Story parsed incrementally with {len(scenes_seen)} scenes")
+                else:
+                    story_data = orjson.loads(cleaned_response)
+                    logger.info(f"✅ Story generated successfully with {len(story_data.get('scenes', []))} scenes")
+                logger.info(f"📊 Story data keys: {list(story_data.keys()) if isinstance(story_data, dict) else 'Not a dict'}")
             
-            # Reconstruct story text with scene markers for frontend compatibility
-            scenes = story_data.get("scenes", [])
-            if scenes:
-                # Build story text with [SCENE X] markers that frontend expects
-                story_with_markers = ""
-                for scene in scenes:
-                    scene_index = scene.get("index", 1)
-                    scene_text = scene.get("text", "")
-                    story_with_markers += f"[SCENE {scene_index}]\n{scene_text}\n\n"
-                story_text = story_with_markers.strip()
-            else:
-                # Fallback to the raw story if no scenes
-                story_text = story_data.get("story", "")
+                # Reconstruct story text with scene markers for frontend compatibility
+                scenes = story_data.get("scenes", [])
+                if scenes:
+                    # Build story text with [SCENE X] markers that frontend
+                    # expects; accumulate into a list and join once — += on a
+                    # str re-copies the whole buffer per scene
+                    marker_parts = [
+                        f"[SCENE {scene.get('index', 1)}]\n{scene.get('text', '')}\n\n"
+                        for scene in scenes
+                    ]
+                    story_text = "".join(marker_parts).rstrip()
+                else:
+                    # Fallback to the raw story if no scenes
+                    story_text = story_data.get("story", "")
             
-            # Send story in chunks to avoid message size limits
-            chunk_size = 2000  # Send in 2KB chunks
-            if len(story_text) > chunk_size:
-                # Send in chunks
-                for i in range(0, len(story_text), chunk_size):
-                    chunk = story_text[i:i + chunk_size]
-                    is_final = i + chunk_size >= len(story_text)
-                    await websocket.send_text(json.dumps({
-                        "type": "story_chunk", 
-                        "data": chunk,
-                        "partial": not is_final
-                    }))
-                    
-                # Send completion marker
-                await websocket.send_text(json.dumps({
-                    "type": "story_complete", 
-                    "data": ""  # Empty data since content was already sent in chunks
-                }))
-            else:
-                # Send complete story if small enough
-                await websocket.send_text(json.dumps({
+                # One message for the final text: the websocket layer already
+                # fragments large frames, so manual 2KB slicing only multiplied
+                # JSON encodes and frame headers. Incremental UX comes from the
+                # story_chunk messages sent during streaming above.
+                _enqueue(send_queue, {
                     "type": "story_complete", 
                     "data": story_text
-                }))
-            logger.info(f"📤 Sent story text with scene markers to frontend ({len(story_text)} characters)")
+                })
+                logger.info(f"📤 Sent story text with scene markers to frontend ({len(story_text)} characters)")
             
-        except json.JSONDecodeError as e:
-            logger.error(f"❌ Failed to parse story JSON: {e}")
-            logger.error(f"📄 Raw response (first 500 chars): {story_response[:500]}")
-            logger.error(f"📄 Cleaned response (first 500 chars): {cleaned_response[:500] if 'cleaned_response' in locals() else 'N/A'}")
-            raise Exception(f"Story agent returned invalid JSON format: {e}")
+            except orjson.JSONDecodeError as e:
+                logger.error(f"❌ Failed to parse story JSON: {e}")
+                logger.error(f"📄 Raw response (first 500 chars): {story_response[:500]}")
+                logger.error(f"📄 Cleaned response (first 500 chars): {cleaned_response[:500] if 'cleaned_response' in locals() else 'N/A'}")
+                raise Exception(f"Story agent returned invalid JSON format: {e}")
             
-    except Exception as e:
-        logger.error(f"❌ Story generation failed for user {user_id}: {e}")
-        import traceback
-        logger.error(f"📋 Full story generation traceback: {traceback.format_exc()}")
-        await websocket.send_text(json.dumps({"type": "error", "message": f"Story generation failed: {str(e)}"}))
-        return
-
-    # Step 2: Generate images using DirectImageAgent
-    if story_data and direct_image_agent and story_data.get("scenes"):
-        logger.info("🎨 Starting image generation with DirectImageAgent...")
-        
-        # Extract character descriptions from story data
-        character_descriptions = {}
-        if story_data.get("main_characters"):
-            for character in story_data["main_characters"]:
-                char_name = character.get("name", "")
-                char_desc = character.get("description", "")
-                if char_name and char_desc:
-                    character_descriptions[char_name] = char_desc
-            logger.info(f"📚 Found {len(character_descriptions)} main character(s): {', '.join(character_descriptions.keys())}")
-        
-        for scene in story_data["scenes"]:
-            scene_index = scene.get("index", 1) - 1  # Convert to 0-based index
-            scene_description = scene.get("description", "")
-            
-            try:
-                logger.info(f"🖼️ Generating image for scene {scene_index + 1}: {scene.get('title', 'Unknown')}")
-                
-                # Use DirectImageAgent to generate image with character descriptions
-                result_data = await direct_image_agent.generate_image_from_description(
-                    scene_description,
-                    character_descriptions
-                )
-                
+        except Exception as e:
+            logger.error("❌ Story generation failed for user %s: %s", user_id, e)
+            logger.debug("Story generation traceback", exc_info=True)
+            _enqueue(send_queue, {"type": "error", "message": f"Story generation failed: {str(e)}"})
+            return
+
+        # Step 2: Generate images using DirectImageAgent
+        if story_data and direct_image_agent and story_data.get("scenes"):
+            logger.info("🎨 Starting image generation with DirectImageAgent...")
+
+            # Backfill anything the incremental parser missed (e.g. when the
+            # stream died on a malformed fence): characters first, then any
+            # scenes that never got a task
+            if story_data.get("main_characters") and not character_descriptions:
+                for character in story_data["main_characters"]:
+                    char_name = character.get("name", "")
+                    char_desc = character.get("description", "")
+                    if char_name and char_desc:
+                        character_descriptions[char_name] = char_desc
+            if character_descriptions:
+                logger.info(f"📚 Found {len(character_descriptions)} main character(s): {', '.join(character_descriptions.keys())}")
+            if len(image_tasks) < len(story_data["scenes"]):
+                for scene in story_data["scenes"][len(image_tasks):]:
+                    image_tasks.append(asyncio.create_task(_one_scene(scene)))
+
+            # Stream each image to the frontend as soon as it finishes; most
+            # tasks were already started while the story was still streaming
+            for task in asyncio.as_completed(image_tasks):
+                scene, result_data = await task
+                scene_index = scene.get("index", 1) - 1  # Convert to 0-based index
+
                 if result_data.get("success") and result_data.get("images"):
                     for img_data in result_data["images"]:
                         image_payload = {
@@ -257,56 +398,103 @@ async def run_two_agent_workflow(websocket: WebSocket, user_id: str, keywords: s
                             "format": img_data.get("format", "png"),
                             "stored_in_bucket": img_data.get("stored_in_bucket", False)
                         }
-                        
+
                         # Include GCS URL if available
                         if img_data.get("gcs_url"):
                             image_payload["gcs_url"] = img_data["gcs_url"]
                             logger.info(f"✅ Generated image for scene {scene_index + 1} with GCS URL")
-                        
-                        # Include base64 if available (for fallback)
+
+                        # Image bytes travel as a binary frame; only the
+                        # GCS-URL-only path stays in the JSON stream
                         if img_data.get("base64"):
-                            image_payload["base64"] = img_data["base64"]
-                        
-                        await websocket.send_text(json.dumps({
-                            "type": "image_generated",
-                            "data": image_payload
-                        }))
+                            raw_bytes = base64.b64decode(img_data["base64"])
+                            await _send_image_frame(websocket, image_payload, raw_bytes)
+                        else:
+                            _enqueue(send_queue, {
+                                "type": "image_generated",
+                                "data": image_payload
+                            })
                         logger.info(f"📤 Sent image for scene {scene_index + 1} to frontend")
                 else:
-                    raise Exception(f"Image generation failed: {result_data.get('error', 'Unknown error')}")
-                    
-            except Exception as e:
-                logger.error(f"Image generation failed for scene {scene_index + 1}: {e}")
-                # Send error placeholder so frontend knows this slot exists
-                error_payload = {
-                    "index": scene_index,
-                    "scene_title": scene.get("title", ""),
-                    "format": "png",
-                    "stored_in_bucket": False,
-                    "error": f"Image generation failed: {str(e)}",
-                    "placeholder": True
-                }
-                await websocket.send_text(json.dumps({
-                    "type": "image_generated",
-                    "data": error_payload
-                }))
-                logger.info(f"📤 Sent error placeholder for scene {scene_index + 1}")
-            
-            # Small delay between images to avoid rate limiting
-            if scene_index < len(story_data["scenes"]) - 1:
-                await asyncio.sleep(2)
-                
-        logger.info("🎨 All image generation completed")
-    else:
-        if not direct_image_agent:
-            logger.warning("⚠️ DirectImageAgent not available, skipping image generation")
-        elif not story_data.get("scenes"):
-            logger.warning("⚠️ No scenes found in story data, skipping image generation")
+                    error = result_data.get("error", "Unknown error")
+                    logger.error(f"Image generation failed for scene {scene_index + 1}: {error}")
+                    # Send error placeholder so frontend knows this slot exists
+                    error_payload = {
+                        "index": scene_index,
+                        "scene_title": scene.get("title", ""),
+                        "format": "png",
+                        "stored_in_bucket": False,
+                        "error": f"Image generation failed: {error}",
+                        "placeholder": True
+                    }
+                    _enqueue(send_queue, {
+                        "type": "image_generated",
+                        "data": error_payload
+                    })
+                    logger.info(f"📤 Sent error placeholder for scene {scene_index + 1}")
+
+            logger.info("🎨 All image generation completed")
+        else:
+            if not direct_image_agent:
+                logger.warning("⚠️ DirectImageAgent not available, skipping image generation")
+            elif not story_data.get("scenes"):
+                logger.warning("⚠️ No scenes found in story data, skipping image generation")
     
-    # Send completion notification
-    await websocket.send_text(json.dumps({"type": "turn_complete", "turn_complete": True}))
+        # Send completion notification
+        send_queue.put_nowait(_TURN_COMPLETE_MSG)
+    finally:
+        # Structured cancellation: if the connection drops or an error
+        # unwinds the workflow while images are still in flight, cancel
+        # them so no orphaned Imagen calls (and their quota) outlive the
+        # request
+        for task in image_tasks:
+            if not task.done():
+                task.cancel()
+        # The in-memory session service keeps every past session (and its
+        # event buffer) resident forever; drop this request's session so a
+        # long-lived instance doesn't leak one per story
+        if story_runner is not None and story_session is not None:
+            try:
+                await story_runner.session_service.delete_session(
+                    app_name=APP_NAME, user_id=f"{user_id}_story", session_id=story_session.id
+                )
+            except Exception as e:
+                logger.debug("Could not delete story session: %s", e)
+
+
+
+async def _handle_generate_story(websocket: WebSocket, user_id: str, data: str, send_queue: asyncio.Queue):
+    """Run the full story + image workflow for one request."""
+    logger.info(f"🎯 Story generation request received from user {user_id}: '{data}'")
+    try:
+        # Send processing notification
+        send_queue.put_nowait(_PROCESSING_MSG)
+
+        # Run the clean two-agent workflow
+        await run_two_agent_workflow(websocket, user_id, data, send_queue)
+        logger.info(f"✅ Completed two-agent workflow for user {user_id}")
+
+    except Exception as e:
+        logger.error("❌ Error in websocket workflow for user %s: %s", user_id, e)
+        logger.debug("Workflow traceback", exc_info=True)
+        _enqueue(send_queue, {
+            "type": "error",
+            "message": f"Story generation failed: {str(e)}"
+        })
+
+
+async def _handle_ping(websocket: WebSocket, user_id: str, data: str, send_queue: asyncio.Queue):
+    """Answer keepalive pings."""
+    send_queue.put_nowait(_PONG_MSG)
 
 
+# O(1) message dispatch; adding a type means adding a handler here rather
+# than growing a branch chain on the hot receive loop
+_HANDLERS = {
+    "generate_story": _handle_generate_story,
+    "ping": _handle_ping,
+}
+
 
 @app.websocket("/ws/{user_id}")
 async def websocket_endpoint(websocket: WebSocket, user_id: str):
@@ -320,66 +508,58 @@ async def websocket_endpoint(websocket: WebSocket, user_id: str):
     await websocket.accept()
     logger.info(f"Client #{user_id} connected")
 
+    # Disable Nagle so streamed story chunks leave immediately instead of
+    # coalescing at ~40ms kernel boundaries, and widen the send buffer for
+    # the larger image frames. Not every server stack exposes the raw
+    # socket, so treat it as best-effort.
+    transport = websocket.scope.get("transport")
+    sock = transport.get_extra_info("socket") if transport else None
+    if sock is not None:
+        try:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 262144)
+        except OSError as e:
+            logger.debug("Could not tune websocket socket: %s", e)
+
+    # All outbound traffic funnels through one queue + writer task so
+    # producers never block and bursts leave as merged frames
+    send_queue = asyncio.Queue(maxsize=256)
+    writer_task = asyncio.create_task(_writer_loop(websocket, send_queue))
+
     try:
         # Send connection confirmation
-        await websocket.send_text(json.dumps({
-            "type": "connected",
-            "message": "Connected to StoryGen backend"
-        }))
+        send_queue.put_nowait(_CONNECTED_MSG)
 
         while True:
             # Receive message from client
             logger.info(f"⏳ Waiting for message from user {user_id}")
             message_json = await websocket.receive_text()
+            if len(message_json) > _MAX_MESSAGE_BYTES:
+                logger.warning(f"Oversize message ({len(message_json)} bytes) from user {user_id} rejected")
+                _enqueue(send_queue, {"type": "error", "message": "Message too large"})
+                continue
             logger.info(f"📩 Received raw message from user {user_id}: {message_json}")
-            message = json.loads(message_json)
-            
-            message_type = message.get("type")
-            data = message.get("data", "")
+            message = orjson.loads(message_json)
             
-            if message_type == "generate_story":
-                logger.info(f"🎯 Story generation request received from user {user_id}: '{data}'")
-                try:
-                    # Send processing notification
-                    await websocket.send_text(json.dumps({
-                        "type": "processing",
-                        "message": "Generating story and images..."
-                    }))
-                    logger.info(f"📤 Sent processing notification to user {user_id}")
-                    
-                    # Run the clean two-agent workflow
-                    logger.info(f"🚀 Starting two-agent workflow for user {user_id}")
-                    await run_two_agent_workflow(websocket, user_id, data)
-                    logger.info(f"✅ Completed two-agent workflow for user {user_id}")
-                    
-                except Exception as e:
-                    logger.error(f"❌ Error in websocket workflow for user {user_id}: {e}")
-                    import traceback
-                    logger.error(f"📋 Full traceback: {traceback.format_exc()}")
-                    await websocket.send_text(json.dumps({
-                        "type": "error",
-                        "message": f"Story generation failed: {str(e)}"
-                    }))
-                
-            elif message_type == "ping":
-                # Handle ping/keepalive messages
-                await websocket.send_text(json.dumps({"type": "pong"}))
-                
-            else:
-                logger.warning(f"Unknown message type: {message_type}")
+            handler = _HANDLERS.get(message.get("type"))
+            if handler is None:
+                logger.warning(f"Unknown message type: {message.get('type')}")
+                continue
+            await handler(websocket, user_id, message.get("data", ""), send_queue)
 
     except WebSocketDisconnect:
         logger.info(f"Client #{user_id} disconnected")
     except Exception as e:
         logger.error(f"WebSocket error for user {user_id}: {e}")
         try:
-            await websocket.send_text(json.dumps({
+            await websocket.send_text(orjson.dumps({
                 "type": "error",
                 "message": f"Server error: {str(e)}"
-            }))
+            }).decode())
         except:
             pass
     finally:
+        writer_task.cancel()
         logger.info(f"Client #{user_id} connection closed")
 
 @app.get("/health")
@@ -392,7 +572,29 @@ async def root():
     """Root endpoint"""
     return {"message": "StoryGen Backend API", "version": "2.0.0", "workflow": "sequential"}
 
+def _select_event_loop() -> str:
+    """Pick the fastest event loop implementation available on this host."""
+    if sys.platform in ("linux", "darwin"):
+        return "uvloop"
+    return "auto"  # uvloop does not support Windows
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8000))  # Use PORT env var from Cloud Run, default to 8000
-    uvicorn.run(app, host="0.0.0.0", port=port) 
\ No newline at end of file
+    # uvloop + httptools: C-accelerated event loop and HTTP parser; the
+    # many-small-send websocket workload is dominated by per-await loop
+    # overhead, which uvloop roughly halves
+    uvicorn.run(
+        app,
+        host="0.0.0.0",
+        port=port,
+        loop=_select_event_loop(),
+        http="httptools",
+        ws="websockets",
+        # Cap inbound frame size and the per-connection receive queue so a
+        # misbehaving client is bounded at the protocol layer too
+        ws_max_size=_MAX_MESSAGE_BYTES,
+        ws_max_queue=32,
+        log_level="info",
+    ) 
\ No newline at end of file
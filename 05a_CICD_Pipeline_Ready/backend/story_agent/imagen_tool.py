@@ -1,7 +1,9 @@
 import os
 import json
 import base64
+import asyncio
 import tempfile
+import threading
 from typing import Dict, Any, List
 import vertexai
 from vertexai.preview.vision_models import ImageGenerationModel
@@ -14,6 +16,41 @@ from datetime import datetime
 
 load_dotenv()
 
+# Process-wide singletons: Vertex AI init, the Imagen model handle, and the
+# GCS client all pay real setup cost (auth, model metadata, connection
+# channels) and are safe to share across tool instances and websocket
+# connections, so build each exactly once
+_INIT_LOCK = threading.Lock()
+_MODEL = None
+_STORAGE_CLIENT = None
+
+
+def _get_model(project_id: str, location: str) -> ImageGenerationModel:
+    """Return the shared Imagen model, initializing Vertex AI on first use."""
+    global _MODEL
+    if _MODEL is None:
+        with _INIT_LOCK:
+            if _MODEL is None:
+                vertexai.init(project=project_id, location=location)
+                _MODEL = ImageGenerationModel.from_pretrained("imagegeneration@006")
+    return _MODEL
+
+
+def _get_storage_client(project_id: str) -> storage.Client:
+    """Return the shared GCS client, creating it on first use."""
+    global _STORAGE_CLIENT
+    if _STORAGE_CLIENT is None:
+        with _INIT_LOCK:
+            if _STORAGE_CLIENT is None:
+                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
+                if creds_path and os.path.exists(creds_path):
+                    credentials = service_account.Credentials.from_service_account_file(creds_path)
+                    _STORAGE_CLIENT = storage.Client(credentials=credentials, project=project_id)
+                else:
+                    # Try default credentials
+                    _STORAGE_CLIENT = storage.Client(project=project_id)
+    return _STORAGE_CLIENT
+
 
 class ImagenTool(BaseTool):
     """
@@ -37,21 +74,18 @@ class ImagenTool(BaseTool):
         if not self._bucket_name:
             print("⚠️  Warning: GENMEDIA_BUCKET not set. Images will be returned as base64 payloads which may cause token issues.")
         
-        # Initialize Vertex AI
-        vertexai.init(project=self._project_id, location=self._location)
-        self._model = ImageGenerationModel.from_pretrained("imagegeneration@006")
+        # Initialize Vertex AI (shared across instances)
+        self._model = _get_model(self._project_id, self._location)
         
-        # Initialize GCS client if bucket is configured
+        # Initialize GCS client if bucket is configured (shared across
+        # instances); the bucket handle is cached too so uploads skip the
+        # per-call lookup
         self._storage_client = None
+        self._bucket = None
         if self._bucket_name:
             try:
-                creds_path = os.getenv("GOOGLE_APPLICATION_CREDENTIALS")
-                if creds_path and os.path.exists(creds_path):
-                    credentials = service_account.Credentials.from_service_account_file(creds_path)
-                    self._storage_client = storage.Client(credentials=credentials, project=self._project_id)
-                else:
-                    # Try default credentials
-                    self._storage_client = storage.Client(project=self._project_id)
+                self._storage_client = _get_storage_client(self._project_id)
+                self._bucket = self._storage_client.bucket(self._bucket_name)
                 print(f"✅ GCS client initialized for bucket: {self._bucket_name}")
             except Exception as e:
                 print(f"⚠️  Failed to initialize GCS client: {e}")
@@ -112,8 +146,12 @@ class ImagenTool(BaseTool):
             
             print(f"🎨 Generating image with prompt: {full_prompt}")
             
-            # Generate image using Vertex AI Imagen
-            response = self._model.generate_images(
+            # Generate image using Vertex AI Imagen. The SDK call is a
+            # blocking HTTP request; run it in a worker thread so concurrent
+            # scene tasks actually overlap instead of serializing on the
+            # event loop
+            response = await asyncio.to_thread(
+                self._model.generate_images,
                 prompt=full_prompt,
                 number_of_images=number_of_images,
                 negative_prompt=negative_prompt,
@@ -293,9 +331,8 @@ class ImagenTool(BaseTool):
         
         blob_name = f"generated_images/{timestamp}_{safe_prompt}_{index}_{unique_id}.png"
         
-        # Upload to bucket
-        bucket = self._storage_client.bucket(self._bucket_name)
-        blob = bucket.blob(blob_name)
+        # Upload through the cached bucket handle
+        blob = self._bucket.blob(blob_name)
         
         with open(local_path, 'rb') as image_file:
             blob.upload_from_file(image_file, content_type='image/png')
@@ -33,13 +33,15 @@ class DirectImageAgent:
         else:
             raise ValueError("Project ID is required for DirectImageAgent")
     
-    async def generate_image_from_description(self, description: str, character_descriptions: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+    async def generate_image_from_description(self, description: str, character_descriptions: Optional[Dict[str, str]] = None, char_prefix: Optional[str] = None) -> Dict[str, Any]:
         """
         Generate an image from a scene description with consistent character appearances
         
         Args:
             description: Scene description for image generation (action and setting)
             character_descriptions: Dict mapping character names to their visual descriptions
+            char_prefix: Pre-rendered character reference block; when given it is
+                used as-is and character_descriptions is not re-joined
             
         Returns:
             Dict containing the image generation results
@@ -51,7 +53,7 @@ class DirectImageAgent:
             }
         
         # Create a prompt from the description and character info
-        prompt = self._create_prompt_from_description(description, character_descriptions)
+        prompt = self._create_prompt_from_description(description, character_descriptions, char_prefix)
         
         try:
             # Use ImagenTool directly
@@ -71,13 +73,15 @@ class DirectImageAgent:
                 "error": f"Image generation failed: {str(e)}"
             }
     
-    def _create_prompt_from_description(self, description: str, character_descriptions: Optional[Dict[str, str]] = None) -> str:
+    def _create_prompt_from_description(self, description: str, character_descriptions: Optional[Dict[str, str]] = None, char_prefix: Optional[str] = None) -> str:
         """
         Transform a scene description into a proper image generation prompt with consistent characters
         
         Args:
             description: Scene description (action and setting)
             character_descriptions: Dict mapping character names to their visual descriptions
+            char_prefix: Pre-rendered character reference block, joined once by
+                the caller so per-scene calls skip rebuilding it
             
         Returns:
             Formatted prompt for image generation
@@ -102,13 +106,12 @@ class DirectImageAgent:
         
         # Then add ALL character descriptions to ensure consistency
         # The AI will understand which characters to include based on the scene description
-        if character_descriptions:
-            character_details = []
-            for name, char_desc in character_descriptions.items():
-                character_details.append(f"{name} is {char_desc}")
-            
-            if character_details:
-                scene_parts.append(f"Character reference guide: {'; '.join(character_details)}")
+        if char_prefix is None and character_descriptions:
+            char_prefix = "; ".join(
+                f"{name} is {char_desc}" for name, char_desc in character_descriptions.items()
+            )
+        if char_prefix:
+            scene_parts.append(f"Character reference guide: {char_prefix}")
         
         # Combine everything with the locked style
         # Add explicit consistency instructions
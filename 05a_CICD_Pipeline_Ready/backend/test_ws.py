@@ -0,0 +1,92 @@
+"""
+WebSocket latency probe for the StoryGen backend.
+
+Connects once, sends a generate_story request, and counts frames instead
+of printing each one — a per-message print blocks the event loop and
+turns the measurement into a benchmark of the terminal. TLS uses the
+default verified context (never CERT_NONE, which also forces slower ssl
+fallback paths). Reports time-to-first-token, time-to-last-image, and
+frame/byte totals at the end.
+
+Usage:
+    python test_ws.py --uri ws://localhost:8000/ws/loadtest --keywords "brave robot"
+"""
+import ssl
+import time
+import asyncio
+import argparse
+
+import orjson
+import websockets
+
+
+async def _ticker(stats):
+    """Print aggregate progress once a second instead of per frame."""
+    while True:
+        await asyncio.sleep(1)
+        print(f"  {stats['frames']} frames, {stats['bytes']} bytes so far")
+
+
+async def run(uri: str, keywords: str, timeout: float):
+    ssl_context = ssl.create_default_context() if uri.startswith("wss://") else None
+    stats = {"frames": 0, "bytes": 0}
+    started = time.perf_counter()
+    first_token = None
+    last_image = None
+    images = 0
+
+    async with websockets.connect(uri, ssl=ssl_context, max_size=None) as ws:
+        await ws.send(orjson.dumps({"type": "generate_story", "data": keywords}).decode())
+        ticker = asyncio.create_task(_ticker(stats))
+        try:
+            done = False
+            while not done:
+                frame = await asyncio.wait_for(ws.recv(), timeout=timeout)
+                stats["frames"] += 1
+                stats["bytes"] += len(frame)
+
+                if isinstance(frame, bytes):
+                    # Binary image frame: 4-byte header length + meta + PNG
+                    images += 1
+                    last_image = time.perf_counter()
+                    continue
+
+                # The server merges queued messages into newline-delimited frames
+                for line in frame.split("\n"):
+                    msg = orjson.loads(line)
+                    mtype = msg.get("type")
+                    if mtype == "story_chunk" and first_token is None:
+                        first_token = time.perf_counter()
+                    elif mtype == "image_generated":
+                        images += 1
+                        last_image = time.perf_counter()
+                    elif mtype == "error":
+                        print(f"server error: {msg.get('message')}")
+                    elif mtype == "turn_complete":
+                        done = True
+        finally:
+            ticker.cancel()
+
+    print("--- summary ---")
+    print(f"frames received:     {stats['frames']}")
+    print(f"bytes received:      {stats['bytes']}")
+    print(f"images received:     {images}")
+    if first_token is not None:
+        print(f"time to first token: {first_token - started:.2f}s")
+    if last_image is not None:
+        print(f"time to last image:  {last_image - started:.2f}s")
+    print(f"total wallclock:     {time.perf_counter() - started:.2f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="StoryGen websocket latency probe")
+    parser.add_argument("--uri", default="ws://localhost:8000/ws/loadtest")
+    parser.add_argument("--keywords", default="a brave little robot")
+    parser.add_argument("--timeout", type=float, default=120.0,
+                        help="per-frame receive timeout in seconds")
+    args = parser.parse_args()
+    asyncio.run(run(args.uri, args.keywords, args.timeout))
+
+
+if __name__ == "__main__":
+    main()
@@ -121,111 +121,133 @@ export default function Home() {
         }
       };
 
-      ws.onmessage = (event) => {
-        try {
-          const message: WebSocketMessage = JSON.parse(event.data);
-          console.log('Received message:', message);
-
-          switch (message.type) {
-            case 'connected':
-              console.log('Backend connection confirmed');
-              break;
-
-            case 'processing':
-              setIsGenerating(true);
-              setImageGenerationStatus(message.message || 'Generating...');
-              break;
-
-            case 'story_chunk':
-              if (message.data) {
-                if (message.partial) {
-                  // Append to existing story
-                  setStory(prev => prev + message.data);
-                } else {
-                  // Final chunk or complete story
-                  setStory(prev => prev + message.data);
-                }
-              }
-              break;
-
-            case 'story_complete':
-              if (message.data) {
-                // Complete story received
-                setStory(message.data);
-                console.log('Complete story received:', message.data.length, 'characters');
-              }
-              break;
-
-            case 'tool_call':
-              // Handle tool call notifications
-              const toolMessage = message as any;
-              if (toolMessage.tool_name === 'generate_image') {
-                setIsGeneratingImages(true);
-                setImageGenerationStatus(`Generating image: ${toolMessage.parameters?.prompt || 'Unknown prompt'}`);
-                console.log('Image generation started:', toolMessage.parameters);
-              }
-              break;
-
-                          case 'image_generated':
-              // Backend now may send either a full result object or a single image payload
-              try {
-                const payload: any = message.data;
-                if (payload && Array.isArray(payload.images)) {
-                  // Original shape with images array
-                  setGeneratedImages(prev => [...prev, ...payload.images]);
-                  setImageGenerationStatus('Generated image batch');
-                  console.log('Image batch received:', payload);
-                } else if (payload && (payload.gcs_url || payload.base64)) {
-                  // Single image payload
-                  const img: GeneratedImage = {
-                    index: typeof payload.index === 'number' ? payload.index : (generatedImages.length % 4),
-                    format: payload.format || 'png',
-                    stored_in_bucket: payload.stored_in_bucket ?? !!payload.gcs_url,
-                    ...(payload.gcs_url ? { gcs_url: payload.gcs_url } : {}),
-                    ...(payload.base64 ? { base64: payload.base64 } : {})
-                  };
-                  
-                  // Place the image at its specific index
-                  setGeneratedImages(prev => {
-                    const newImages = [...prev];
-                    newImages[img.index] = img;
-                    return newImages;
-                  });
-                  
-                  setImageGenerationStatus(`Generated image ${img.index + 1} of 4`);
-                  console.log('Single image received:', img);
-                } else {
-                  console.warn('Unknown image payload shape:', payload);
-                }
-              } catch (imageError) {
-                console.error('Error processing image data:', imageError);
-                setImageGenerationStatus('Error processing generated image');
+      const handleMessage = (message: WebSocketMessage) => {
+        console.log('Received message:', message);
+
+        switch (message.type) {
+          case 'connected':
+            console.log('Backend connection confirmed');
+            break;
+
+          case 'processing':
+            setIsGenerating(true);
+            setImageGenerationStatus(message.message || 'Generating...');
+            break;
+
+          case 'story_chunk':
+            if (message.data) {
+              if (message.partial) {
+                // Append to existing story
+                setStory(prev => prev + message.data);
+              } else {
+                // Final chunk or complete story
+                setStory(prev => prev + message.data);
               }
-              break;
-
-            case 'turn_complete':
-              if (message.turn_complete) {
-                setIsGenerating(false);
-                setIsGeneratingImages(false);
-                setImageGenerationStatus('');
-                console.log('Story and image generation completed');
+            }
+            break;
+
+          case 'story_complete':
+            if (message.data) {
+              // Complete story received
+              setStory(message.data);
+              console.log('Complete story received:', message.data.length, 'characters');
+            }
+            break;
+
+          case 'tool_call':
+            // Handle tool call notifications
+            const toolMessage = message as any;
+            if (toolMessage.tool_name === 'generate_image') {
+              setIsGeneratingImages(true);
+              setImageGenerationStatus(`Generating image: ${toolMessage.parameters?.prompt || 'Unknown prompt'}`);
+              console.log('Image generation started:', toolMessage.parameters);
+            }
+            break;
+
+                        case 'image_generated':
+            // Backend now may send either a full result object or a single image payload
+            try {
+              const payload: any = message.data;
+              if (payload && Array.isArray(payload.images)) {
+                // Original shape with images array
+                setGeneratedImages(prev => [...prev, ...payload.images]);
+                setImageGenerationStatus('Generated image batch');
+                console.log('Image batch received:', payload);
+              } else if (payload && (payload.gcs_url || payload.base64)) {
+                // Single image payload
+                const img: GeneratedImage = {
+                  index: typeof payload.index === 'number' ? payload.index : (generatedImages.length % 4),
+                  format: payload.format || 'png',
+                  stored_in_bucket: payload.stored_in_bucket ?? !!payload.gcs_url,
+                  ...(payload.gcs_url ? { gcs_url: payload.gcs_url } : {}),
+                  ...(payload.base64 ? { base64: payload.base64 } : {})
+                };
+                
+                // Place the image at its specific index
+                setGeneratedImages(prev => {
+                  const newImages = [...prev];
+                  newImages[img.index] = img;
+                  return newImages;
+                });
+                
+                setImageGenerationStatus(`Generated image ${img.index + 1} of 4`);
+                console.log('Single image received:', img);
+              } else {
+                console.warn('Unknown image payload shape:', payload);
               }
-              break;
-
-            case 'error':
-              console.error('Server error:', message.message);
-              setConnectionError(message.message || 'Server error occurred');
+            } catch (imageError) {
+              console.error('Error processing image data:', imageError);
+              setImageGenerationStatus('Error processing generated image');
+            }
+            break;
+
+          case 'turn_complete':
+            if (message.turn_complete) {
               setIsGenerating(false);
               setIsGeneratingImages(false);
               setImageGenerationStatus('');
-              break;
+              console.log('Story and image generation completed');
+            }
+            break;
+
+          case 'error':
+            console.error('Server error:', message.message);
+            setConnectionError(message.message || 'Server error occurred');
+            setIsGenerating(false);
+            setIsGeneratingImages(false);
+            setImageGenerationStatus('');
+            break;
+
+          case 'pong':
+            // Handle ping/pong for keepalive
+            break;
+
+          default:
+            console.log('Unknown message type:', message.type);
+        }
+      };
 
-            case 'pong':
-              // Handle ping/pong for keepalive
-              break;
+      // Binary image frame from the backend: 4-byte big-endian header
+      // length, JSON metadata, then raw PNG bytes. Decode the metadata and
+      // hand the bytes to the existing image path as an object URL.
+      const handleBinaryFrame = (buffer: ArrayBuffer) => {
+        const headerLen = new DataView(buffer).getUint32(0);
+        const meta = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 4, headerLen)));
+        const png = new Blob([new Uint8Array(buffer, 4 + headerLen)], { type: `image/${meta.format || 'png'}` });
+        handleMessage({ type: 'image_generated', data: { ...meta, gcs_url: URL.createObjectURL(png) } } as any);
+      };
 
-            default:
-              console.log('Unknown message type:', message.type);
+      ws.binaryType = 'arraybuffer';
+      ws.onmessage = (event) => {
+        try {
+          if (event.data instanceof ArrayBuffer) {
+            handleBinaryFrame(event.data);
+            return;
+          }
+          // The server merges queued payloads into one newline-delimited
+          // frame; split and handle each JSON message individually
+          for (const raw of (event.data as string).split('\n')) {
+            if (raw) handleMessage(JSON.parse(raw));
           }
         } catch (error) {
           console.error('Error parsing WebSocket message:', error);